@@ -1,18 +1,15 @@
 import subprocess
+import threading
 import time
 import os
 import typer
 import platform
 import webbrowser
 import psutil
-import ngrok
-import segno
 import json
 
 from pathlib import Path
-from livekit import api
-from source.server.livekit.worker import main as worker_main
-from source.server.livekit.multimodal import main as multimodal_main
+from source.server.utils.startup import Startup, StartupError, http_probe, tcp_probe
 
 from dotenv import load_dotenv
 
@@ -26,27 +23,83 @@ app = typer.Typer()
 
 ROOM_NAME = "my-room"
 
+# Imported only by the branches of run() that need them, measured by --import-times
+LAZY_MODULES = [
+    "source.server.livekit.worker",
+    "source.server.livekit.multimodal",
+    "source.server.livekit.sessions",
+    "livekit.api",
+    "ngrok",
+    "segno",
+]
 
-def pre_clean_process(port):
-    """Find and kill process running on specified port"""
-    for proc in psutil.process_iter(['pid', 'name', 'connections']):
+
+# How long processes holding our ports get to exit after SIGTERM before they are killed
+PORT_CLEAN_TIMEOUT = 3.0
+
+
+def port_index(ports):
+    """Map each of ports to the pids with a socket bound to it, from one snapshot of the host's sockets"""
+    index = {port: set() for port in ports}
+    try:
+        connections = [(conn.laddr, conn.pid) for conn in psutil.net_connections(kind="inet")]
+    except psutil.AccessDenied:
+        # macOS only lists other processes' sockets to root, look at our own processes instead
+        connections = []
+        username = psutil.Process().username()
+        for proc in psutil.process_iter(['username']):
+            if proc.info['username'] != username:
+                continue
+            try:
+                connections.extend((conn.laddr, proc.pid) for conn in proc.connections(kind="inet"))
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    for laddr, pid in connections:
+        if laddr and laddr.port in index and pid and pid != os.getpid():
+            index[laddr.port].add(pid)
+    return index
+
+
+def pre_clean_process(ports, timeout=PORT_CLEAN_TIMEOUT):
+    """Find and stop the processes running on the specified ports"""
+    start = time.perf_counter()
+    procs = {}
+    for port, pids in port_index(ports).items():
+        for pid in pids:
+            if pid in procs:
+                continue
+            try:
+                proc = psutil.Process(pid)
+                print(f"Killing process {proc.pid} ({proc.name()}) on port {port}")
+                proc.terminate()
+                procs[pid] = proc
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+
+    _, alive = psutil.wait_procs(procs.values(), timeout=timeout)
+    for proc in alive:
+        print(f"Process {proc.pid} did not exit after {timeout:.0f} s, killing it")
         try:
-            for conn in proc.connections():
-                if conn.laddr.port == port:
-                    print(f"Killing process {proc.pid} ({proc.name()}) on port {port}")
-                    proc.terminate()
-                    proc.wait()
-                    return True
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            proc.kill()
+        except psutil.NoSuchProcess:
             pass
-    return False
+    psutil.wait_procs(alive, timeout=1)
 
+    print(f"Cleaned up ports {', '.join(map(str, ports))} in {(time.perf_counter() - start) * 1000:.0f} ms ({len(procs)} processes stopped)")
+    return bool(procs)
 
-def cleanup_processes(processes):
+
+def cleanup_processes(processes, timeout=PORT_CLEAN_TIMEOUT):
     for process in processes:
         if process.poll() is None:  # if process is still running
             process.terminate()
-            process.wait()  # wait for process to terminate
+    for process in processes:
+        try:
+            process.wait(timeout)  # wait for process to terminate
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
 
 
 @app.command()
@@ -82,12 +135,28 @@ def run(
         False,
         "--multimodal",
         help="Run the multimodal agent",
-    )
+    ),
+    sessions: bool = typer.Option(
+        False,
+        "--sessions",
+        help="Give every user their own room and agent, with tokens handed out by a local HTTP endpoint. Limit concurrent sessions with 01_MAX_SESSIONS",
+    ),
+    import_times: bool = typer.Option(
+        False,
+        "--import-times",
+        help="Print how long the CLI and each module it imports lazily take to import, then exit",
+    ),
 ):  
-    # preprocess ports
-    ports = [10101, 8000, 3000]
-    for port in ports:
-        pre_clean_process(port)
+    if debug:
+        # read when the worker modules are imported below, and by the job processes
+        os.environ["DEBUG"] = "true"
+
+    profiles_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "source", "server", "profiles")
+
+    if import_times:
+        from source.server.utils.import_times import import_time_report
+        print(import_time_report(["main", *LAZY_MODULES], cwd=os.path.dirname(os.path.realpath(__file__))))
+        exit(0)
 
     if profiles:
         if platform.system() == "Windows":
@@ -100,7 +169,12 @@ def run(
             subprocess.Popen(['open', profiles_dir])
         exit(0)
 
-    profiles_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), "source", "server", "profiles")
+    # preprocess ports
+    ports = [10101, 8000, 3000]
+    if sessions:
+        from source.server.livekit.sessions import SESSION_PORT
+        ports.append(SESSION_PORT)
+    pre_clean_process(ports)
 
     if profile:
         if not os.path.isfile(profile):
@@ -112,65 +186,112 @@ def run(
                     exit(1)
 
 
-    OI_CMD = f"interpreter --serve --profile {profile}"
-    oi_server = subprocess.Popen(OI_CMD, shell=True)
-    print("Interpreter server started")
-    
+    # everything is launched at once, then each step waits only for what it needs
+    startup = Startup()
+
+    # job processes load the same profile when they run the interpreter in-process
+    os.environ["01_INTERPRETER_PROFILE"] = profile
+    interpreter_server = multimodal or os.getenv('01_INTERPRETER_BACKEND', 'server').lower() != "in-process"
+
+    if interpreter_server:
+        OI_CMD = f"interpreter --serve --profile {profile}"
+        print("Starting interpreter server...")
+        interpreter_url = f"http://{os.getenv('INTERPRETER_SERVER_HOST', 'localhost')}:{os.getenv('INTERPRETER_SERVER_PORT', '8000')}/"
+        startup.launch("interpreter", OI_CMD, http_probe(interpreter_url), shell=True)
 
     print("Starting livekit server...")
     if debug: 
         LK_CMD = f"livekit-server --dev --bind {lk_host} --port {lk_port}"
     else:
         LK_CMD = f"livekit-server --dev --bind {lk_host} --port {lk_port} > /dev/null 2>&1"
-    
-    lk_server = subprocess.Popen(LK_CMD, shell=True)
-    print("Livekit server started")
-    time.sleep(2)
-
-    lk_url = f"http://{lk_host}:{lk_port}"
-    participant_token = str(api.AccessToken('devkey', 'secret') \
-                .with_identity("Participant") \
-                .with_name("You") \
-                .with_grants(api.VideoGrants(
-                    room_join=True,
-                    room=ROOM_NAME,))
-                .to_jwt())
-
-    processes = [lk_server, oi_server]
-
-    if client == 'mobile':
-        listener =  ngrok.forward(f"{lk_host}:{lk_port}", authtoken_from_env=True, domain=domain)
-        lk_url = listener.url()
-        print(f"Livekit server forwarded to: {lk_url}")
-
-        print("Scan the QR code below with your mobile app to connect to the livekit server.")
-        content = json.dumps({"livekit_server": lk_url, "token": participant_token})
-        qr_code = segno.make(content)
-        qr_code.terminal(compact=True)
-    else: # meet client
+    lk_probe_host = "localhost" if lk_host == "0.0.0.0" else lk_host
+    startup.launch("livekit", LK_CMD, tcp_probe(lk_probe_host, lk_port), shell=True)
+
+    if client != 'mobile':
         # Get the path to the meet client directory
         meet_client_path = Path(__file__).parent / "source" / "clients" / "meet"
-
         print("Starting Next.js dev server...")
-        next_server = subprocess.Popen(["pnpm", "dev"], cwd=meet_client_path,)
-        print("Next.js dev server started")
-
-        time.sleep(2)
-        meet_url = f'http://localhost:3000/custom?liveKitUrl={lk_url.replace("http", "ws")}&token={participant_token}'
-        print(f"\nOpening meet interface at: {meet_url}")
-        webbrowser.open(meet_url)
+        startup.launch("meet", ["pnpm", "dev"], http_probe("http://localhost:3000/"), cwd=meet_client_path)
 
-        processes.append(next_server)
-    
+    session_server = None
     try:
+        lk_url = f"http://{lk_host}:{lk_port}"
+
+        if client == 'mobile':
+            import ngrok
+            listener =  ngrok.forward(f"{lk_host}:{lk_port}", authtoken_from_env=True, domain=domain)
+            lk_url = listener.url()
+            startup.mark("ngrok")
+            print(f"Livekit server forwarded to: {lk_url}")
+
+        meet_url = f'http://localhost:3000/custom?liveKitUrl={lk_url.replace("http", "ws")}&token={{token}}'
+
+        if sessions:
+            from source.server.livekit.sessions import SessionManager, SessionServer, SessionServerError
+            # every user gets a room, token and agent job of their own
+            session_server = SessionServer(
+                SessionManager(f"http://localhost:{lk_port}", 'devkey', 'secret'),
+                client_url=lk_url,
+                meet_url=meet_url,
+            )
+            try:
+                session_server.start()
+                print(f"Session endpoint at {session_server.url} (POST /session for a token, GET / to open a meet session)")
+                participant_token = session_server.mint().token
+            except SessionServerError as e:
+                raise StartupError(f"session endpoint: {e}") from e
+        else:
+            from livekit import api
+            participant_token = str(api.AccessToken('devkey', 'secret') \
+                        .with_identity("Participant") \
+                        .with_name("You") \
+                        .with_grants(api.VideoGrants(
+                            room_join=True,
+                            room=ROOM_NAME,))
+                        .to_jwt())
+
+        if client == 'mobile':
+            import segno
+            print("Scan the QR code below with your mobile app to connect to the livekit server.")
+            content = json.dumps({"livekit_server": lk_url, "token": participant_token})
+            qr_code = segno.make(content)
+            qr_code.terminal(compact=True)
+        else: # meet client
+            meet_url = meet_url.format(token=participant_token)
+
+            def _open_meet():
+                # Next.js can take longer to compile than the rest takes to start
+                try:
+                    startup.wait("meet")
+                except StartupError as e:
+                    print(f"Meet client not available: {e}")
+                    return
+                print(f"\nOpening meet interface at: {meet_url}")
+                webbrowser.open(meet_url)
+
+            threading.Thread(target=_open_meet, name="open-meet", daemon=True).start()
+
+        # the worker needs the livekit server, and the interpreter server unless it runs the
+        # multimodal agent or the interpreter in-process
+        startup.wait("livekit", *(["interpreter"] if interpreter_server and not multimodal else []))
+        startup.mark("worker")
+        print(startup.report())
+
         print("Starting worker...")
         if multimodal:
+            from source.server.livekit.multimodal import main as multimodal_main
             multimodal_main(lk_url)
         else:
+            from source.server.livekit.worker import main as worker_main
             worker_main(lk_url)
         print("Worker started")
+    except StartupError as e:
+        print(f"Startup failed: {e}")
+        print(startup.report())
     except KeyboardInterrupt:
         print("\nReceived interrupt signal, shutting down...")
     finally:
         print("Cleaning up processes...")
-        cleanup_processes(processes)
\ No newline at end of file
+        if session_server:
+            session_server.stop()
+        cleanup_processes(startup.processes)
\ No newline at end of file
@@ -0,0 +1,352 @@
+"""Offline end-to-end latency benchmark for the voice worker.
+
+Starts a local livekit-server, the fake providers from fakes.py and the real
+worker (01_STT=local, 01_TTS=local, LLM on 127.0.0.1:8000). It then joins a room
+per session as a participant, speaks the recorded WAV utterances into it and
+times each turn from the end of the utterance to the first agent audio heard
+back. Nothing leaves the machine.
+
+    python -m source.server.benchmark path/to/utterances --sessions 3
+
+Each utterance is a 16-bit PCM .wav file. A .txt file next to it (same stem)
+holds the transcript the fake STT replays. Otherwise the stem is used.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import wave
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import psutil
+import typer
+from livekit import api, rtc
+
+from source.server.benchmark.fakes import FakeLLM, FakeSTT, FakeTTS, serve
+from source.server.livekit.tracing import PERCENTILES, percentile
+
+
+SOFTWARE_DIR = Path(__file__).resolve().parents[3]
+
+SAMPLE_RATE = 48000
+FRAME_MS = 10
+# agent audio above this RMS counts as speech (the fake TTS tone is ~5600)
+SPEECH_RMS = 500
+# how long the agent has to be quiet before we consider its reply finished
+SILENCE_SECONDS = 1.2
+TURN_TIMEOUT = 30
+
+app = typer.Typer()
+
+
+@dataclass
+class Utterance:
+    name: str
+    samples: np.ndarray
+    transcript: str
+
+
+def load_utterances(wav_dir: Path) -> list[Utterance]:
+    utterances = []
+    for path in sorted(wav_dir.glob("*.wav")):
+        with wave.open(str(path), "rb") as wav:
+            if wav.getsampwidth() != 2:
+                raise typer.BadParameter(f"{path.name}: only 16-bit PCM wav files are supported")
+            samples = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+            if wav.getnchannels() > 1:
+                samples = samples.reshape(-1, wav.getnchannels()).mean(axis=1).astype(np.int16)
+            if wav.getframerate() != SAMPLE_RATE:
+                duration = len(samples) / wav.getframerate()
+                target = np.linspace(0, len(samples) - 1, int(duration * SAMPLE_RATE))
+                samples = np.interp(target, np.arange(len(samples)), samples).astype(np.int16)
+
+        transcript_path = path.with_suffix(".txt")
+        transcript = transcript_path.read_text().strip() if transcript_path.exists() else path.stem.replace("_", " ")
+        utterances.append(Utterance(path.stem, samples, transcript))
+
+    if not utterances:
+        raise typer.BadParameter(f"no .wav files found in {wav_dir}")
+    return utterances
+
+
+class Microphone:
+    """Publishes 10 ms frames in real time: queued speech, silence otherwise.
+
+    VAD needs to keep hearing audio to detect the end of speech, so silence is
+    sent continuously rather than stopping the track.
+    """
+
+    def __init__(self):
+        self.source = rtc.AudioSource(SAMPLE_RATE, 1)
+        self._pending = np.zeros(0, dtype=np.int16)
+        self._done: asyncio.Future | None = None
+
+    async def run(self):
+        samples_per_frame = SAMPLE_RATE * FRAME_MS // 1000
+        start = time.monotonic()
+        sent = 0
+        while True:
+            chunk = self._pending[:samples_per_frame]
+            self._pending = self._pending[samples_per_frame:]
+            if len(chunk) < samples_per_frame:
+                chunk = np.pad(chunk, (0, samples_per_frame - len(chunk)))
+            frame = rtc.AudioFrame(chunk.tobytes(), SAMPLE_RATE, 1, samples_per_frame)
+            await self.source.capture_frame(frame)
+            sent += 1
+
+            if self._done is not None and not len(self._pending):
+                self._done.set_result(time.monotonic())
+                self._done = None
+
+            await asyncio.sleep(max(start + sent * FRAME_MS / 1000 - time.monotonic(), 0))
+
+    async def say(self, samples: np.ndarray) -> float:
+        """Queue an utterance and return the monotonic time its last sample went out."""
+        self._done = asyncio.get_running_loop().create_future()
+        self._pending = samples
+        return await self._done
+
+
+class AgentListener:
+    """Tracks when the agent's audio track goes from silence to speech and back."""
+
+    def __init__(self):
+        self.onsets: list[float] = []
+        self.last_speech = 0.0
+        self._changed = asyncio.Event()
+
+    async def listen(self, track: rtc.Track):
+        async for event in rtc.AudioStream(track):
+            samples = np.frombuffer(event.frame.data, dtype=np.int16).astype(np.float32)
+            if not len(samples) or np.sqrt(np.mean(samples ** 2)) < SPEECH_RMS:
+                continue
+            now = time.monotonic()
+            if now - self.last_speech > SILENCE_SECONDS:
+                self.onsets.append(now)
+                self._changed.set()
+            self.last_speech = now
+
+    async def wait_onset(self, after: float) -> float:
+        while True:
+            for onset in self.onsets:
+                if onset >= after:
+                    return onset
+            self._changed.clear()
+            await self._changed.wait()
+
+    async def wait_silence(self):
+        while time.monotonic() - self.last_speech < SILENCE_SECONDS:
+            await asyncio.sleep(0.1)
+
+
+class ProcessSampler:
+    """Samples CPU time and RSS of the worker and its job processes."""
+
+    def __init__(self, root: psutil.Process):
+        self.root = root
+        self.cpu: dict[int, tuple[float, float]] = {}
+        self.peak_rss = 0
+        self.since = time.time()
+
+    def sample(self):
+        try:
+            processes = [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return
+
+        rss = 0
+        for proc in processes:
+            try:
+                times = proc.cpu_times()
+                rss += proc.memory_info().rss
+                created = proc.create_time()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            used = times.user + times.system
+            if proc.pid not in self.cpu:
+                # job processes started during the session count from zero
+                self.cpu[proc.pid] = (0.0 if created >= self.since else used, used)
+            self.cpu[proc.pid] = (self.cpu[proc.pid][0], used)
+        self.peak_rss = max(self.peak_rss, rss)
+
+    def reset(self):
+        self.sample()
+        self.cpu = {pid: (last, last) for pid, (_, last) in self.cpu.items()}
+        self.peak_rss = 0
+        self.since = time.time()
+
+    @property
+    def cpu_seconds(self) -> float:
+        return sum(last - first for first, last in self.cpu.values())
+
+    async def run(self, interval: float = 0.1):
+        while True:
+            self.sample()
+            await asyncio.sleep(interval)
+
+
+async def run_session(index: int, lk_url: str, utterances: list[Utterance], stt: FakeSTT) -> list[float]:
+    room_name = f"bench-{index}-{int(time.time())}"
+    token = (
+        api.AccessToken("devkey", "secret")
+        .with_identity(f"bench-{index}")
+        .with_grants(api.VideoGrants(room_join=True, room=room_name))
+        .to_jwt()
+    )
+
+    room = rtc.Room()
+    listener = AgentListener()
+    tasks = []
+
+    @room.on("track_subscribed")
+    def on_track_subscribed(track: rtc.Track, publication: rtc.TrackPublication, participant: rtc.RemoteParticipant):
+        if track.kind == rtc.TrackKind.KIND_AUDIO:
+            tasks.append(asyncio.create_task(listener.listen(track)))
+
+    await room.connect(lk_url, token)
+    mic = Microphone()
+    track = rtc.LocalAudioTrack.create_audio_track("microphone", mic.source)
+    await room.local_participant.publish_track(track, rtc.TrackPublishOptions(source=rtc.TrackSource.SOURCE_MICROPHONE))
+    tasks.append(asyncio.create_task(mic.run()))
+
+    latencies = []
+    try:
+        # let the greeting play out before the first turn
+        await asyncio.wait_for(listener.wait_onset(0), TURN_TIMEOUT)
+        await listener.wait_silence()
+
+        for utterance in utterances:
+            stt.transcript = utterance.transcript
+            spoken_at = await mic.say(utterance.samples)
+            heard_at = await asyncio.wait_for(listener.wait_onset(spoken_at), TURN_TIMEOUT)
+            latencies.append((heard_at - spoken_at) * 1000)
+            typer.echo(f"  session {index} {utterance.name}: {latencies[-1]:.0f} ms")
+            await listener.wait_silence()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await room.disconnect()
+
+    return latencies
+
+
+def wait_for_port(port: int, timeout: float = 15):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(("127.0.0.1", port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError(f"nothing listening on port {port} after {timeout}s")
+
+
+async def run_benchmark(
+    utterances: list[Utterance],
+    sessions: int,
+    lk_port: int,
+    llm: FakeLLM,
+    stt: FakeSTT,
+    tts: FakeTTS,
+) -> dict:
+    runners = [
+        await serve(llm.app(), "127.0.0.1", 8000),
+        await serve(stt.app(), "127.0.0.1", 9002),
+        await serve(tts.app(), "127.0.0.1", 9001),
+    ]
+
+    lk_server = subprocess.Popen(
+        ["livekit-server", "--dev", "--bind", "127.0.0.1", "--port", str(lk_port)],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    lk_url = f"ws://127.0.0.1:{lk_port}"
+
+    env = {
+        **os.environ,
+        "01_STT": "local",
+        "01_TTS": "local",
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "benchmark"),
+        "DEBUG": "true",
+        "01_TRACE_FILE": str(SOFTWARE_DIR / "benchmark_trace.jsonl"),
+    }
+    worker = None
+    results = {"sessions": []}
+    try:
+        await asyncio.to_thread(wait_for_port, lk_port)
+        worker = subprocess.Popen(
+            [sys.executable, "-c", f"from source.server.livekit.worker import main; main({lk_url!r})"],
+            cwd=SOFTWARE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        sampler = ProcessSampler(psutil.Process(worker.pid))
+        sampler_task = asyncio.create_task(sampler.run())
+
+        for index in range(sessions):
+            sampler.reset()
+            latencies = await run_session(index, lk_url, utterances, stt)
+            sampler.sample()
+            results["sessions"].append({
+                "latencies_ms": [round(latency, 1) for latency in latencies],
+                "cpu_s": round(sampler.cpu_seconds, 2),
+                "peak_rss_mb": round(sampler.peak_rss / 1024 / 1024, 1),
+            })
+
+        sampler_task.cancel()
+    finally:
+        for proc in (worker, lk_server):
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+                proc.wait()
+        for runner in runners:
+            await runner.cleanup()
+
+    return results
+
+
+def print_report(results: dict):
+    latencies = [latency for session in results["sessions"] for latency in session["latencies_ms"]]
+    typer.echo(f"\nturn latency, end of utterance -> first agent audio ({len(latencies)} turns)")
+    typer.echo("".join(f"{f'p{q}':>10}" for q in PERCENTILES))
+    typer.echo("".join(f"{percentile(latencies, q):>10.0f}" for q in PERCENTILES))
+
+    typer.echo(f"\n{'session':<10}{'turns':>8}{'cpu_s':>10}{'peak_rss_mb':>14}")
+    for index, session in enumerate(results["sessions"]):
+        typer.echo(f"{index:<10}{len(session['latencies_ms']):>8}{session['cpu_s']:>10.2f}{session['peak_rss_mb']:>14.1f}")
+
+
+@app.command()
+def main(
+    wav_dir: Path = typer.Argument(..., exists=True, file_okay=False, help="Directory of .wav utterances (with optional .txt transcripts)"),
+    sessions: int = typer.Option(3, "--sessions", help="Number of sessions to run one after another"),
+    lk_port: int = typer.Option(10101, "--lk-port", help="Port for the local livekit server"),
+    token_rate: float = typer.Option(40.0, "--token-rate", help="Tokens per second streamed by the fake LLM"),
+    first_token_delay: float = typer.Option(0.3, "--first-token-delay", help="Seconds before the fake LLM's first token"),
+    stt_latency: float = typer.Option(0.15, "--stt-latency", help="Seconds the fake STT takes per request"),
+    tts_first_byte: float = typer.Option(0.1, "--tts-first-byte", help="Seconds before the fake TTS's first audio"),
+    tts_realtime_factor: float = typer.Option(4.0, "--tts-realtime-factor", help="How much faster than realtime the fake TTS emits audio"),
+    output: Path = typer.Option(None, "--output", help="Also write the raw results as JSON"),
+):
+    utterances = load_utterances(wav_dir)
+    results = asyncio.run(run_benchmark(
+        utterances,
+        sessions,
+        lk_port,
+        FakeLLM(token_rate=token_rate, first_token_delay=first_token_delay),
+        FakeSTT(latency=stt_latency),
+        FakeTTS(first_byte_delay=tts_first_byte, realtime_factor=tts_realtime_factor),
+    ))
+    print_report(results)
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    app()
@@ -0,0 +1,139 @@
+"""Local stand-ins for the providers the worker talks to.
+
+They speak the same HTTP APIs the worker already uses for its "local" providers,
+so the real entrypoint runs against them unchanged:
+
+- an OpenAI-compatible chat completions server (where the Open Interpreter server
+  normally listens), streaming tokens at a configurable rate
+- an OpenAI-compatible transcription server (01_STT=local) that replays scripted
+  transcripts
+- an OpenAI-compatible speech server (01_TTS=local) that emits PCM at a fixed rate
+"""
+
+import asyncio
+import json
+import time
+import uuid
+
+import numpy as np
+from aiohttp import web
+
+
+DEFAULT_REPLY = (
+    "Sure. I looked into it and everything seems to be working as expected. "
+    "Let me know if there is anything else you would like me to do."
+)
+
+TTS_SAMPLE_RATE = 24000
+
+
+class FakeLLM:
+    """Streams a canned reply word by word after first_token_delay seconds."""
+
+    def __init__(self, token_rate: float = 40.0, first_token_delay: float = 0.3, reply: str = DEFAULT_REPLY):
+        self.token_rate = token_rate
+        self.first_token_delay = first_token_delay
+        self.reply = reply
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_get("/", self._health)
+        app.router.add_post("/chat/completions", self._chat_completions)
+        app.router.add_post("/v1/chat/completions", self._chat_completions)
+        return app
+
+    async def _health(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def _chat_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        def chunk(delta: dict, finish_reason=None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return f"data: {json.dumps(payload)}\n\n".encode()
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        await asyncio.sleep(self.first_token_delay)
+        await response.write(chunk({"role": "assistant", "content": ""}))
+        for i, word in enumerate(self.reply.split(" ")):
+            if i:
+                await asyncio.sleep(1 / self.token_rate)
+            await response.write(chunk({"content": word if i == 0 else " " + word}))
+        await response.write(chunk({}, finish_reason="stop"))
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+class FakeSTT:
+    """Answers every transcription request with the current scripted transcript."""
+
+    def __init__(self, latency: float = 0.15):
+        self.latency = latency
+        self.transcript = ""
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post("/v1/audio/transcriptions", self._transcriptions)
+        return app
+
+    async def _transcriptions(self, request: web.Request) -> web.Response:
+        await request.read()
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(
+            {"task": "transcribe", "language": "en", "duration": 0.0, "text": self.transcript, "segments": []}
+        )
+
+
+class FakeTTS:
+    """Emits a quiet 220 Hz tone as 16-bit PCM, paced at realtime_factor x realtime."""
+
+    def __init__(self, first_byte_delay: float = 0.1, realtime_factor: float = 4.0, chars_per_second: float = 15.0):
+        self.first_byte_delay = first_byte_delay
+        self.realtime_factor = realtime_factor
+        self.chars_per_second = chars_per_second
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/audio/speech", self._speech)
+        return app
+
+    async def _speech(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+
+        duration = max(len(body.get("input", "")) / self.chars_per_second, 0.2)
+        t = np.arange(int(duration * TTS_SAMPLE_RATE)) / TTS_SAMPLE_RATE
+        pcm = (np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16).tobytes()
+
+        response = web.StreamResponse(headers={"Content-Type": "audio/pcm"})
+        await response.prepare(request)
+        await asyncio.sleep(self.first_byte_delay)
+
+        chunk_bytes = TTS_SAMPLE_RATE // 10 * 2  # 100 ms of audio
+        for offset in range(0, len(pcm), chunk_bytes):
+            await response.write(pcm[offset:offset + chunk_bytes])
+            await asyncio.sleep(0.1 / self.realtime_factor)
+        await response.write_eof()
+        return response
+
+
+async def serve(app: web.Application, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
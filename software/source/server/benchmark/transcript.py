@@ -0,0 +1,85 @@
+"""Micro-benchmark of push-to-talk transcript handling on long dictation sessions.
+
+Replays a session where the user submits with {COMPLETE} every few segments.
+Compares the character-by-character prefix scan the worker used to do on the
+whole running transcript with TranscriptAccumulator, which gets each segment
+on its own, as the agent hands it over once before_llm_cb returned False.
+
+    python -m source.server.benchmark.transcript --segments 2000
+"""
+
+import random
+import time
+
+import typer
+
+from source.server.livekit.tracing import PERCENTILES, percentile
+from source.server.livekit.transcript import TranscriptAccumulator
+
+
+WORDS = "the a turn on light fan please open file run code check email weather today tomorrow and then".split()
+
+
+def prefix_scan(submitted: str, transcript: str) -> str:
+    """What _before_llm_cb used to do to find the text after the submitted part."""
+    end = 0
+    while submitted and submitted[end] == transcript[end]:
+        end += 1
+        if end == len(submitted):
+            break
+    return transcript[end:]
+
+
+def make_segments(count: int, seed: int) -> list[str]:
+    rng = random.Random(seed)
+    return [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 12))) for _ in range(count)]
+
+
+def run_prefix_scan(segments: list[str], commit_every: int) -> list[float]:
+    timings = []
+    running, submitted, pending = "", "", ""
+    for i, segment in enumerate(segments, 1):
+        running += (" " if running else "") + segment
+        start = time.perf_counter()
+        pending = prefix_scan(submitted, running)
+        timings.append(time.perf_counter() - start)
+        if i % commit_every == 0:
+            submitted += pending
+    return timings
+
+
+def run_accumulator(segments: list[str], commit_every: int) -> list[float]:
+    timings = []
+    transcript = TranscriptAccumulator()
+    for i, segment in enumerate(segments, 1):
+        start = time.perf_counter()
+        transcript.update(segment)
+        timings.append(time.perf_counter() - start)
+        if i % commit_every == 0:
+            transcript.commit()
+    return timings
+
+
+def report(name: str, timings: list[float]):
+    micros = [t * 1e6 for t in timings]
+    tail = micros[-len(micros) // 10:]
+    print(
+        f"{name:<16}"
+        + "".join(f"{f'p{q}':>6} {percentile(micros, q):>9.1f}us" for q in PERCENTILES)
+        + f"   last 10% p50 {percentile(tail, 50):>9.1f}us   total {sum(timings) * 1000:>8.1f}ms"
+    )
+
+
+def main(
+    segments: int = typer.Option(2000, help="Transcript segments in the session"),
+    commit_every: int = typer.Option(5, help="Segments between {COMPLETE} submissions"),
+    seed: int = typer.Option(0),
+):
+    session = make_segments(segments, seed)
+    print(f"{segments} segments, {sum(len(s) + 1 for s in session)} characters, commit every {commit_every}")
+    report("prefix scan", run_prefix_scan(session, commit_every))
+    report("accumulator", run_accumulator(session, commit_every))
+
+
+if __name__ == "__main__":
+    typer.run(main)
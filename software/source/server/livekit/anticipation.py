@@ -1,18 +1,23 @@
-from typing import Any, Dict
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
 import json
-import base64
+import time
 import traceback
-import io
+import os
 import re
-from PIL import Image as PIL_Image
+import numpy as np
 
-from openai import OpenAI
-from livekit.agents.llm import ChatContext
+from livekit.agents.llm import ChatContext, LLMStream
+from livekit.agents.stt import SpeechEvent, SpeechEventType
 from livekit import rtc
 from livekit.agents.pipeline import VoicePipelineAgent
 from livekit.agents.llm.chat_context import ChatContext
 from source.server.livekit.logger import log_message
-from livekit.agents.llm.chat_context import ChatImage
+from source.server.livekit.frame_encoder import get_frame_encoder
+from source.server.livekit.image_budget import ImageBudget
+from source.server.livekit.timeline import rgba_view, signature
+from source.server.livekit.tracing import percentile
+from source.server.livekit.vision_client import get_vision_client
 
 
 # Add these constants after the existing ones
@@ -35,25 +40,218 @@ RESPONSE_FORMAT = """
 """
 
 
+# Mean absolute difference (0-255) of a 32x32 grayscale signature below which the scene counts as unchanged
+SCENE_GATE_THRESHOLD = float(os.getenv('01_SCENE_GATE_THRESHOLD', '6'))
+SCENE_GATE_SIZE = 32
+
+
+class SceneGate:
+    """Skips instruction checks while the camera sees the same scene as the last checked frame.
+
+    Compares a downsampled grayscale copy of each frame with the one that was
+    last sent for checking and hands back that check's verdict instead of
+    making another remote call.
+    """
+
+    def __init__(self, threshold: float = SCENE_GATE_THRESHOLD):
+        self.threshold = threshold
+        self.last_signature: np.ndarray | None = None
+        self.last_result: Dict[str, Any] | None = None
+        self.checks_sent = 0
+        self.checks_skipped = 0
+
+    def cached_result(self, video_frame: rtc.VideoFrame) -> Dict[str, Any] | None:
+        """Return the last verdict if the scene hasn't materially changed, else None."""
+        if self.last_result is None or video_frame.type != rtc.VideoBufferType.RGBA:
+            return None
+
+        frame_signature = signature(rgba_view(video_frame), SCENE_GATE_SIZE)
+        difference = np.abs(frame_signature - self.last_signature).mean()
+        if difference > self.threshold:
+            log_message("Scene changed (difference %.1f), checking frame", difference)
+            return None
+
+        self.checks_skipped += 1
+        log_message("Scene unchanged (difference %.1f), reusing last verdict", difference)
+        return self.last_result
+
+    def record(self, video_frame: rtc.VideoFrame, result: Dict[str, Any]):
+        """Remember the frame that was checked and its verdict."""
+        self.checks_sent += 1
+        if "error" in result or video_frame.type != rtc.VideoBufferType.RGBA:
+            # don't reuse a failed check, the next frame gets checked again
+            self.last_result = None
+            return
+        self.last_signature = signature(rgba_view(video_frame), SCENE_GATE_SIZE)
+        self.last_result = result
+
+    def stats(self) -> Dict[str, int]:
+        return {"checks_sent": self.checks_sent, "checks_skipped": self.checks_skipped}
+
+
+# Start the LLM request before the user's turn ends. Off by default: a request that
+# is cancelled may already have run code on the Open Interpreter server
+SPECULATIVE_LLM = os.getenv('01_SPECULATIVE_LLM', 'false').lower() == 'true'
+# How long the interim transcript must stay the same before the request is started
+SPECULATIVE_STABLE_MS = float(os.getenv('01_SPECULATIVE_STABLE_MS', '300'))
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercased words without punctuation, for comparing transcripts."""
+    return " ".join(re.sub(r"[^\w\s]", "", text.lower()).split())
+
+
+class SpeculativeLLM:
+    """Starts the LLM request on a stable interim transcript.
+
+    Interim and final STT events build up the transcript of the user's turn.
+    Once it has been unchanged for stable_ms, start_fnc starts an LLM request
+    for it. If the question the agent commits matches, take() hands that
+    request over, along with how long it has already been running. Otherwise
+    it is closed. A change in the transcript closes any request already
+    started for the old text.
+    """
+
+    def __init__(
+        self,
+        start_fnc: Callable[[str], Awaitable[LLMStream | None]],
+        stable_ms: float = SPECULATIVE_STABLE_MS,
+        enabled: bool = SPECULATIVE_LLM,
+    ):
+        self.start_fnc = start_fnc
+        self.stable_ms = stable_ms
+        self.enabled = enabled
+
+        self._finals = ""
+        self._text = ""
+        self._timer: asyncio.Task | None = None
+        self._stream: LLMStream | None = None
+        self._started_at = 0.0
+
+        self.turns = 0
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self.head_starts: list[float] = []
+
+    def on_transcript(self, ev: SpeechEvent):
+        if not self.enabled or not ev.alternatives:
+            return
+        text = ev.alternatives[0].text
+        if ev.type == SpeechEventType.FINAL_TRANSCRIPT:
+            self._finals = f"{self._finals} {text}".strip()
+            candidate = self._finals
+        elif ev.type == SpeechEventType.INTERIM_TRANSCRIPT:
+            candidate = f"{self._finals} {text}".strip()
+        else:
+            return
+
+        if normalize_transcript(candidate) == normalize_transcript(self._text):
+            return
+        self._text = candidate
+        self._cancel_timer()
+        if self._stream:
+            self.discarded += 1
+            self._close_stream()
+        if candidate:
+            self._timer = asyncio.create_task(self._start_when_stable(candidate))
+
+    async def _start_when_stable(self, text: str):
+        await asyncio.sleep(self.stable_ms / 1000)
+        try:
+            stream = await self.start_fnc(text)
+        except Exception as e:
+            log_message("Failed to start speculative LLM request: %s", e)
+            return
+        if stream is None:
+            return
+        self._stream = stream
+        self._started_at = time.monotonic()
+        self.started += 1
+        log_message("Started speculative LLM request for: %s", text)
+
+    def _cancel_timer(self):
+        if self._timer and not self._timer.done():
+            self._timer.cancel()
+        self._timer = None
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream:
+            asyncio.create_task(stream.aclose())
+
+    async def take(self, question: str) -> tuple[LLMStream | None, float]:
+        """The speculative request for question, if one was started, and its head start in seconds."""
+        stream, head_start = None, 0.0
+        if self.enabled:
+            self.turns += 1
+        if self._stream and normalize_transcript(question) == normalize_transcript(self._text):
+            stream, self._stream = self._stream, None
+            head_start = time.monotonic() - self._started_at
+            self.hits += 1
+            self.head_starts.append(head_start)
+            log_message("Speculative LLM hit, %.0f ms head start", head_start * 1000)
+        elif self._stream:
+            self.misses += 1
+            log_message("Speculative LLM miss for %r, committed %r", self._text, question)
+        self.reset()
+        return stream, head_start
+
+    def reset(self):
+        """Forget the current turn, closing any request started for it."""
+        self._cancel_timer()
+        self._close_stream()
+        self._finals = ""
+        self._text = ""
+
+    async def aclose(self):
+        self._cancel_timer()
+        if self._stream:
+            stream, self._stream = self._stream, None
+            await stream.aclose()
+
+    def stats(self) -> Dict[str, Any]:
+        taken = self.hits + self.misses
+        return {
+            "turns": self.turns,
+            "started": self.started,
+            "hits": self.hits,
+            "misses": self.misses,
+            "discarded": self.discarded,
+            "hit_rate": round(self.hits / taken, 2) if taken else None,
+            "head_start_ms_p50": round(percentile(self.head_starts, 50) * 1000, 1) if self.head_starts else None,
+        }
+
+
 # Add this function to handle safety check callbacks
 async def handle_instruction_check(
     assistant: VoicePipelineAgent,
     video_frame: rtc.VideoFrame,
+    scene_gate: SceneGate | None = None,
+    owner: str = "",
+    image_budget: ImageBudget | None = None,
 ):
     """Handle safety check callback from video processor"""
     log_message("Starting instruction check process...")
     
     try:
-        log_message("Calling check_instruction_violation...")
-        result = await check_instruction_violation(
-            chat_ctx=assistant.chat_ctx,
-            video_frame=video_frame,
-        )
+        result = scene_gate.cached_result(video_frame) if scene_gate else None
+        if result is None:
+            log_message("Calling check_instruction_violation...")
+            result = await check_instruction_violation(
+                chat_ctx=assistant.chat_ctx,
+                video_frame=video_frame,
+                owner=owner,
+            )
+            if scene_gate:
+                scene_gate.record(video_frame, result)
+                log_message("Scene gate stats: %s", scene_gate.stats())
         
-        log_message(f"Instruction check result: {json.dumps(result, indent=2)}")
+        log_message("Instruction check result: %s", result)
         
         if result["violation_detected"] and result["severity_rating"] >= 7:
-            log_message(f"Violation detected with severity {result['severity_rating']}, triggering assistant response")
+            log_message("Violation detected with severity %s, triggering assistant response", result['severity_rating'])
             
             # Append violation to chat context
             violation_text = f"Instruction violation frame detected: {result['violation_summary']}\nRecommendations: {result['recommendations']}"
@@ -62,19 +260,14 @@ async def handle_instruction_check(
                 text=violation_text
             )
 
-            assistant.chat_ctx.append(
-                role="user",
-                images=[
-                    ChatImage(image=video_frame)
-                ]
-            )
-            log_message(f"Added violation to chat context: {violation_text}")
+            await (image_budget or ImageBudget()).attach(assistant.chat_ctx, video_frame)
+            log_message("Added violation to chat context: %s", violation_text)
 
 
-            log_message(f"Current chat context: {assistant.chat_ctx}")
+            log_message("Current chat context: %s", assistant.chat_ctx)
             
             # Trigger assistant response
-            log_message(f"Triggering assistant response...")
+            log_message("Triggering assistant response...")
 
             # TODO: instead of saying the predetermined response, we'll trigger an assistant response here
             # we can append the current video frame that triggered the violation to the chat context
@@ -91,48 +284,34 @@ async def handle_instruction_check(
         else:
             log_message("No significant violations detected or severity below threshold")
     except Exception as e:
-        log_message(f"Error in handle_instruction_check: {str(e)}")
-        log_message(f"Error traceback: {traceback.format_exc()}")
+        log_message("Error in handle_instruction_check: %s", e)
+        log_message("Error traceback: %s", traceback.format_exc())
 
 
 # Add this function to handle safety check callbacks
 async def check_instruction_violation(
     chat_ctx: ChatContext,
     video_frame: rtc.VideoFrame,
+    owner: str = "",
 ) -> Dict[str, Any]:
     """Makes a call to gpt-4o-mini to check for instruction violations"""
     log_message("Creating new context for instruction check...")
     
     try:
-        client = OpenAI()
+        client = get_vision_client()
         
         try:
-            # Get raw RGBA data
-            frame_data = video_frame.data.tobytes()
-            
-            # Create PIL Image from RGBA data
-            image = PIL_Image.frombytes('RGBA', (video_frame.width, video_frame.height), frame_data)
-            
-            # Convert RGBA to RGB
-            rgb_image = image.convert('RGB')
-            
-            # Save as JPEG
-            buffer = io.BytesIO()
-            rgb_image.save(buffer, format='JPEG')
-            jpeg_bytes = buffer.getvalue()
-            
-            log_message(f"Got frame data, size: {len(jpeg_bytes)} bytes")
-            base64_image = base64.b64encode(jpeg_bytes).decode("utf-8")
+            # Shared with the user's turn, so the same frame is only encoded once
+            image_url = await get_frame_encoder().data_url(video_frame)
             log_message("Successfully encoded frame to base64")
         except Exception as e:
-            log_message(f"Error encoding frame: {str(e)}")
+            log_message("Error encoding frame: %s", e)
             raise
 
         # Get the response
         log_message("Making call to LLM for instruction check...")
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini", 
+            content = await client.complete(
                 messages=[
                     # TODO: append chat context to prompt without images -- we'll need to parse them out 
                     {
@@ -142,41 +321,42 @@ async def check_instruction_violation(
                             {
                                 "type": "image_url",
                                 "image_url": {
-                                    "url": f"data:image/jpeg;base64,{base64_image}",
+                                    "url": image_url,
                                 },
                             },
                         ],
                     }
                 ],
                 max_tokens=300,
+                owner=owner,
             )
-            log_message(f"Raw LLM response: {response}")
         except Exception as e:
-            log_message(f"Error making LLM call: {str(e)}")
+            log_message("Error making LLM call: %s", e)
             raise
         
         try:
             # Parse the response content
             # Clean up the LLM response if it includes ```json ... ```
-            content = response.choices[0].message.content.strip()
+            content = content.strip()
             content = re.sub(r'^```(?:json)?', '', content)  # remove leading triple backticks and optional 'json'
             content = re.sub(r'```$', '', content).strip()   # remove trailing triple backticks
             result = json.loads(content)
             
-            log_message(f"Successfully parsed LLM response: {json.dumps(result, indent=2)}")
+            log_message("Successfully parsed LLM response: %s", result)
             return result
         except Exception as e:
-            log_message(f"Error parsing LLM response: {str(e)}")
+            log_message("Error parsing LLM response: %s", e)
             raise
 
     except Exception as e:
-        log_message(f"Failed to process instruction check: {str(e)}")
-        log_message(f"Error traceback: {traceback.format_exc()}")
+        log_message("Failed to process instruction check: %s", e)
+        log_message("Error traceback: %s", traceback.format_exc())
         default_response = {
             "violation_detected": False,
             "severity_rating": 0,
             "violation_summary": f"Error processing instruction check: {str(e)}",
-            "recommendations": "None"
+            "recommendations": "None",
+            "error": str(e),
         }
-        log_message(f"Returning default response: {json.dumps(default_response, indent=2)}")
+        log_message("Returning default response: %s", default_response)
         return default_response
\ No newline at end of file
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable
+
+from livekit.agents import utils
+
+from source.server.livekit.logger import log_message
+
+
+# Wall-clock limit of one code execution, in seconds
+CODE_TIMEOUT = float(os.getenv('01_CODE_TIMEOUT', '120'))
+# Output returned to the model is cut down to this many characters, keeping its start and end
+CODE_OUTPUT_MAX_CHARS = int(os.getenv('01_CODE_OUTPUT_MAX_CHARS', '4000'))
+# Partial output is published to the client on this data topic, batched over the interval
+CODE_OUTPUT_TOPIC = "code_output"
+CODE_OUTPUT_INTERVAL = 0.25
+
+_DONE = object()
+
+
+class OutputBuffer:
+    """Output of a run, bounded to its first and last max_chars / 2 characters.
+
+    Parts are kept in lists and only joined once, by text().
+    """
+
+    def __init__(self, max_chars: int = CODE_OUTPUT_MAX_CHARS):
+        self.head_chars = max_chars // 2
+        self.tail_chars = max_chars - self.head_chars
+        self._head: list[str] = []
+        self._head_len = 0
+        self._tail: deque[str] = deque()
+        self._tail_len = 0
+        self.dropped = 0
+
+    def append(self, text: str):
+        if self._head_len < self.head_chars:
+            part = text[:self.head_chars - self._head_len]
+            self._head.append(part)
+            self._head_len += len(part)
+            text = text[len(part):]
+        if not text:
+            return
+
+        self._tail.append(text)
+        self._tail_len += len(text)
+        while self._tail_len > self.tail_chars:
+            excess = self._tail_len - self.tail_chars
+            first = self._tail[0]
+            if len(first) <= excess:
+                self._tail.popleft()
+                self._tail_len -= len(first)
+                self.dropped += len(first)
+            else:
+                self._tail[0] = first[excess:]
+                self._tail_len -= excess
+                self.dropped += excess
+
+    def text(self) -> str:
+        head, tail = "".join(self._head), "".join(self._tail)
+        if self.dropped:
+            return f"{head}\n... [{self.dropped} characters of output truncated] ...\n{tail}"
+        return head + tail
+
+
+class CodeRunner:
+    """Runs code through an interpreter's computer on its own thread.
+
+    The event loop (and with it the realtime audio) keeps running while code
+    executes. A run is stopped at its wall-clock timeout or when the calling
+    task is cancelled, and its output is streamed to publish() as it arrives.
+    """
+
+    def __init__(
+        self,
+        computer,
+        publish: Callable[[str], Awaitable[None]] | None = None,
+        timeout: float = CODE_TIMEOUT,
+        max_chars: int = CODE_OUTPUT_MAX_CHARS,
+    ):
+        self.computer = computer
+        self.publish = publish
+        self.timeout = timeout
+        self.max_chars = max_chars
+        # one kernel runs one piece of code at a time
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="code-runner")
+
+    def _produce(self, language: str, code: str, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stop: threading.Event):
+        def _put(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        try:
+            if stop.is_set():
+                return
+            for chunk in self.computer.run(language, code, stream=True, display=False):
+                if stop.is_set():
+                    break
+                if "content" in chunk and type(chunk["content"]) == str:
+                    _put(chunk["content"])
+        except Exception as e:
+            _put(e)
+        finally:
+            _put(_DONE)
+
+    def _interrupt(self):
+        try:
+            self.computer.stop()
+        except Exception as e:
+            log_message("Failed to interrupt running code: %s", e)
+
+    async def _publish(self, run_id: str, **message):
+        if self.publish is None:
+            return
+        try:
+            await self.publish(json.dumps({"id": run_id, **message}))
+        except Exception as e:
+            log_message("Failed to publish code output: %s", e)
+
+    async def run(self, code: str, language: str = "python") -> str:
+        """Run code and return its output, truncated to max_chars."""
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        output = OutputBuffer(self.max_chars)
+        run_id = utils.shortuuid()
+        pending: list[str] = []
+        status = "ok"
+
+        async def _consume():
+            last_publish = time.monotonic()
+            while (item := await queue.get()) is not _DONE:
+                if isinstance(item, Exception):
+                    raise item
+                output.append("\n" + item)
+                pending.append(item)
+                if time.monotonic() - last_publish >= CODE_OUTPUT_INTERVAL:
+                    await self._publish(run_id, type="output", content="\n".join(pending))
+                    pending.clear()
+                    last_publish = time.monotonic()
+
+        start = time.monotonic()
+        loop.run_in_executor(self._executor, self._produce, language, code, loop, queue, stop)
+        try:
+            await asyncio.wait_for(_consume(), self.timeout)
+        except asyncio.TimeoutError:
+            status = "timeout"
+            output.append(f"\n[execution stopped after {self.timeout:g} s]")
+        except asyncio.CancelledError:
+            status = "cancelled"
+            raise
+        except Exception as e:
+            status = "error"
+            output.append(f"\n{type(e).__name__}: {e}")
+        finally:
+            if status != "ok":
+                stop.set()
+                self._interrupt()
+            if pending:
+                await self._publish(run_id, type="output", content="\n".join(pending))
+            await self._publish(run_id, type="end", status=status)
+            log_message(
+                "Ran code in %.0f ms: %s, %s characters of output dropped",
+                (time.monotonic() - start) * 1000, status, output.dropped,
+            )
+        return output.text().strip()
+
+    def aclose(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,182 @@
+import math
+import os
+
+from livekit.agents.llm.chat_context import ChatContext, ChatImage, ChatMessage
+
+from source.server.livekit.logger import log_message
+
+
+# Estimated tokens the chat context may use before older turns are dropped
+CONTEXT_MAX_TOKENS = int(os.getenv('01_CONTEXT_MAX_TOKENS', '8000'))
+# Only the newest images are kept in the context
+CONTEXT_MAX_IMAGES = int(os.getenv('01_CONTEXT_MAX_IMAGES', '2'))
+# Length of the note that stands in for dropped turns
+CONTEXT_SUMMARY_CHARS = int(os.getenv('01_CONTEXT_SUMMARY_CHARS', '1200'))
+
+# Rough token costs: ~4 characters per token, a fixed overhead per message and
+# what a high detail image of about 1024px costs with OpenAI vision models
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+IMAGE_TOKENS = int(os.getenv('01_CONTEXT_IMAGE_TOKENS', '765'))
+
+SUMMARY_PREFIX = "Summary of earlier conversation (older turns were dropped):"
+
+
+def message_text(msg: ChatMessage) -> str:
+    if isinstance(msg.content, str):
+        return msg.content
+    if isinstance(msg.content, list):
+        return " ".join(c for c in msg.content if isinstance(c, str))
+    return ""
+
+
+def message_images(msg: ChatMessage) -> list[ChatImage]:
+    if isinstance(msg.content, ChatImage):
+        return [msg.content]
+    if isinstance(msg.content, list):
+        return [c for c in msg.content if isinstance(c, ChatImage)]
+    return []
+
+
+def count_tokens(msg: ChatMessage) -> int:
+    """Estimated tokens a message costs in an LLM request."""
+    text = message_text(msg)
+    for call in msg.tool_calls or []:
+        text += call.function_info.name + str(call.arguments)
+    return (
+        MESSAGE_OVERHEAD_TOKENS
+        + math.ceil(len(text) / CHARS_PER_TOKEN)
+        + IMAGE_TOKENS * len(message_images(msg))
+    )
+
+
+def count_lmc_tokens(message: dict) -> int:
+    """Estimated tokens of a message in Open Interpreter's format."""
+    if message.get("type") == "image":
+        return MESSAGE_OVERHEAD_TOKENS + IMAGE_TOKENS
+    return MESSAGE_OVERHEAD_TOKENS + math.ceil(len(str(message.get("content") or "")) / CHARS_PER_TOKEN)
+
+
+def trim_lmc(messages: list[dict], max_tokens: int = CONTEXT_MAX_TOKENS) -> int:
+    """Drop the oldest of an interpreter's messages, in place, until they fit max_tokens.
+
+    The history is cut at the start of a user turn, so it never opens with
+    the assistant's code or its output. Returns how many messages were dropped.
+    """
+    tokens = sum(count_lmc_tokens(message) for message in messages)
+    drop = 0
+    while tokens > max_tokens and drop < len(messages) - 1:
+        tokens -= count_lmc_tokens(messages[drop])
+        drop += 1
+    while drop < len(messages) - 1 and messages[drop].get("role") != "user":
+        drop += 1
+    if drop:
+        del messages[:drop]
+    return drop
+
+
+class ChatContextCompactor:
+    """Keeps a chat context within a token budget.
+
+    Applied in place before each LLM request. Images beyond the newest
+    max_images are removed first. If the context is still over max_tokens,
+    the oldest turns are dropped and folded into a short summary note after
+    the system prompt. The system prompt and the latest message are always
+    kept, and a tool call is dropped together with its results.
+
+    A compacted context therefore starts with two system messages, the prompt
+    and the summary. The summary is rewritten in place on later compactions.
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = CONTEXT_MAX_TOKENS,
+        max_images: int = CONTEXT_MAX_IMAGES,
+        summary_chars: int = CONTEXT_SUMMARY_CHARS,
+    ):
+        self.max_tokens = max_tokens
+        self.max_images = max_images
+        self.summary_chars = summary_chars
+
+        self.images_evicted = 0
+        self.messages_dropped = 0
+        self.last_tokens = 0
+
+    def count(self, chat_ctx: ChatContext) -> int:
+        return sum(count_tokens(msg) for msg in chat_ctx.messages)
+
+    def _evict_images(self, chat_ctx: ChatContext):
+        seen = 0
+        for msg in reversed(list(chat_ctx.messages)):
+            images = message_images(msg)
+            if not images:
+                continue
+            keep = max(self.max_images - seen, 0)
+            seen += len(images)
+            if keep >= len(images):
+                continue
+
+            evicted = images[:len(images) - keep]
+            self.images_evicted += len(evicted)
+            content = [c for c in (msg.content if isinstance(msg.content, list) else [msg.content]) if not any(c is image for image in evicted)]
+            if content:
+                msg.content = content
+            else:
+                chat_ctx.messages.remove(msg)
+
+    def _head(self, chat_ctx: ChatContext) -> int:
+        """Number of leading messages that are never dropped (system prompt and summary)."""
+        head = 0
+        while head < len(chat_ctx.messages) and chat_ctx.messages[head].role == "system":
+            head += 1
+        return head
+
+    def _summarize(self, chat_ctx: ChatContext, dropped: list[ChatMessage], head: int):
+        """Fold dropped turns into the summary note after the system prompt."""
+        lines = [f"{msg.role}: {message_text(msg).strip()}" for msg in dropped if msg.role in ("user", "assistant") and message_text(msg).strip()]
+        if not lines:
+            return
+
+        summary = next((msg for msg in chat_ctx.messages[:head] if message_text(msg).startswith(SUMMARY_PREFIX)), None)
+        previous = message_text(summary)[len(SUMMARY_PREFIX):].strip() if summary else ""
+        text = "\n".join(filter(None, [previous, *lines]))
+        # the most recent dropped turns are the most useful, so the oldest text goes first
+        text = text[-self.summary_chars:]
+
+        if summary:
+            summary.content = f"{SUMMARY_PREFIX}\n{text}"
+        else:
+            chat_ctx.messages.insert(head, ChatMessage.create(text=f"{SUMMARY_PREFIX}\n{text}", role="system"))
+
+    def compact(self, chat_ctx: ChatContext) -> int:
+        """Compact chat_ctx in place. Returns its estimated token count afterwards."""
+        self._evict_images(chat_ctx)
+
+        tokens = self.count(chat_ctx)
+        head = self._head(chat_ctx)
+        dropped: list[ChatMessage] = []
+        while tokens > self.max_tokens and len(chat_ctx.messages) - head > 1:
+            msg = chat_ctx.messages.pop(head)
+            dropped.append(msg)
+            tokens -= count_tokens(msg)
+            # results of a dropped tool call are meaningless on their own
+            while len(chat_ctx.messages) - head > 1 and chat_ctx.messages[head].role == "tool":
+                tool_msg = chat_ctx.messages.pop(head)
+                dropped.append(tool_msg)
+                tokens -= count_tokens(tool_msg)
+
+        if dropped:
+            self.messages_dropped += len(dropped)
+            self._summarize(chat_ctx, dropped, head)
+            tokens = self.count(chat_ctx)
+            log_message("Dropped %s messages from the chat context, %s tokens left", len(dropped), tokens)
+
+        self.last_tokens = tokens
+        return tokens
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "context_tokens": self.last_tokens,
+            "images_evicted": self.images_evicted,
+            "messages_dropped": self.messages_dropped,
+        }
@@ -0,0 +1,94 @@
+import asyncio
+import base64
+import io
+import os
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image as PIL_Image
+from livekit import rtc
+
+from source.server.livekit.logger import log_message
+
+
+# Frames are downscaled so their long edge is at most this many pixels before encoding
+ENCODE_LONG_EDGE = int(os.getenv('01_FRAME_LONG_EDGE', '1024'))
+ENCODE_JPEG_QUALITY = int(os.getenv('01_FRAME_JPEG_QUALITY', '80'))
+ENCODE_WORKERS = int(os.getenv('01_FRAME_ENCODE_WORKERS', '2'))
+
+
+def encode_jpeg(video_frame: rtc.VideoFrame, long_edge: int, quality: int) -> bytes:
+    """Downscale and JPEG-encode an RGBA frame. Reads the frame buffer in place."""
+    if video_frame.type != rtc.VideoBufferType.RGBA:
+        video_frame = video_frame.convert(rtc.VideoBufferType.RGBA)
+
+    # frombuffer wraps the frame's memory instead of copying it like tobytes() + frombytes() did
+    image = PIL_Image.frombuffer(
+        'RGBA', (video_frame.width, video_frame.height), video_frame.data, 'raw', 'RGBA', 0, 1
+    )
+    scale = long_edge / max(video_frame.width, video_frame.height)
+    if scale < 1:
+        size = (max(round(video_frame.width * scale), 1), max(round(video_frame.height * scale), 1))
+        image = image.resize(size, PIL_Image.BILINEAR, reducing_gap=2.0)
+
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format='JPEG', quality=quality)
+    return buffer.getvalue()
+
+
+class FrameEncoder:
+    """Encodes video frames to JPEG on a thread pool, once per frame.
+
+    Results are cached per frame object and encode settings, and concurrent
+    requests for the same frame share one encode. The vision check and the
+    user's turn therefore pay for a single encode of the same frame. Cache
+    entries go away with the frame.
+    """
+
+    def __init__(
+        self,
+        long_edge: int = ENCODE_LONG_EDGE,
+        quality: int = ENCODE_JPEG_QUALITY,
+        max_workers: int = ENCODE_WORKERS,
+    ):
+        self.long_edge = long_edge
+        self.quality = quality
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frame-encoder")
+        self._cache: weakref.WeakKeyDictionary[rtc.VideoFrame, dict[tuple, asyncio.Future]] = weakref.WeakKeyDictionary()
+        self.encodes = 0
+        self.cache_hits = 0
+
+    async def encode(self, video_frame: rtc.VideoFrame, long_edge: int | None = None, quality: int | None = None) -> bytes:
+        """JPEG bytes for a frame, encoded at most once per settings."""
+        # frames are never upscaled, so a larger edge encodes the same as the frame's own
+        long_edge = min(long_edge or self.long_edge, max(video_frame.width, video_frame.height))
+        key = (long_edge, quality or self.quality)
+        entries = self._cache.setdefault(video_frame, {})
+
+        future = entries.get(key)
+        if future is not None and not (future.done() and future.exception()):
+            self.cache_hits += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, encode_jpeg, video_frame, *key)
+        entries[key] = future
+        self.encodes += 1
+        jpeg_bytes = await asyncio.shield(future)
+        log_message("Encoded %sx%s frame to %s bytes of JPEG", video_frame.width, video_frame.height, len(jpeg_bytes))
+        return jpeg_bytes
+
+    async def data_url(self, video_frame: rtc.VideoFrame, long_edge: int | None = None, quality: int | None = None) -> str:
+        jpeg_bytes = await self.encode(video_frame, long_edge, quality)
+        return f"data:image/jpeg;base64,{base64.b64encode(jpeg_bytes).decode('utf-8')}"
+
+
+_frame_encoder: FrameEncoder | None = None
+
+
+def get_frame_encoder() -> FrameEncoder:
+    """The worker process's shared FrameEncoder."""
+    global _frame_encoder
+    if _frame_encoder is None:
+        _frame_encoder = FrameEncoder()
+    return _frame_encoder
@@ -0,0 +1,147 @@
+import os
+
+from livekit import rtc
+from livekit.agents.llm.chat_context import ChatContext, ChatImage
+
+from source.server.livekit import logger
+from source.server.livekit.frame_encoder import ENCODE_LONG_EDGE, ENCODE_JPEG_QUALITY, get_frame_encoder
+from source.server.livekit.logger import log_message
+
+
+# Long edge and JPEG quality images start from before the byte limits are applied
+IMAGE_MAX_EDGE = int(os.getenv('01_IMAGE_MAX_EDGE', str(ENCODE_LONG_EDGE)))
+IMAGE_JPEG_QUALITY = int(os.getenv('01_IMAGE_JPEG_QUALITY', str(ENCODE_JPEG_QUALITY)))
+# Encoded size allowed for one image, and for all images in one LLM request
+IMAGE_MAX_BYTES = int(os.getenv('01_IMAGE_MAX_BYTES', str(200 * 1024)))
+REQUEST_IMAGE_MAX_BYTES = int(os.getenv('01_REQUEST_IMAGE_MAX_BYTES', str(600 * 1024)))
+
+# Quality and size an image is never reduced below to meet IMAGE_MAX_BYTES
+MIN_JPEG_QUALITY = 40
+MIN_EDGE = 256
+QUALITY_STEP = 15
+EDGE_STEP = 0.75
+
+DATA_URL_PREFIX = "data:image/jpeg;base64,"
+
+
+def image_bytes(image: ChatImage) -> int:
+    """Encoded size of an image attached as a JPEG data URL, 0 for anything else."""
+    if isinstance(image.image, str) and image.image.startswith(DATA_URL_PREFIX):
+        padding = len(image.image) - len(image.image.rstrip("="))
+        return (len(image.image) - len(DATA_URL_PREFIX)) * 3 // 4 - padding
+    return 0
+
+
+def request_image_bytes(chat_ctx: ChatContext) -> int:
+    """Encoded size of every image in the chat context."""
+    return sum(
+        image_bytes(content)
+        for msg in chat_ctx.messages if isinstance(msg.content, list)
+        for content in msg.content if isinstance(content, ChatImage)
+    )
+
+
+class ImageBudget:
+    """The one place video frames are encoded and sized for the LLM chat context.
+
+    Frames are downscaled to max_edge and encoded at quality. If the result is
+    over max_image_bytes the quality and then the size are stepped down. Before
+    the image is appended, the oldest images in the context are dropped until
+    the total fits max_request_bytes.
+
+    bytes_saved counts the bytes of dropped images and, when debugging, what
+    downscaling saved against a full-resolution encode.
+    """
+
+    def __init__(
+        self,
+        max_edge: int = IMAGE_MAX_EDGE,
+        quality: int = IMAGE_JPEG_QUALITY,
+        max_image_bytes: int = IMAGE_MAX_BYTES,
+        max_request_bytes: int = REQUEST_IMAGE_MAX_BYTES,
+    ):
+        self.max_edge = max_edge
+        self.quality = quality
+        self.max_image_bytes = max_image_bytes
+        self.max_request_bytes = max_request_bytes
+
+        self.images_sent = 0
+        self.images_dropped = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+
+    async def fit(self, video_frame: rtc.VideoFrame) -> tuple[str, int]:
+        """Encode a frame within max_image_bytes. Returns the data URL and its size."""
+        encoder = get_frame_encoder()
+        edge, quality = min(self.max_edge, max(video_frame.width, video_frame.height)), self.quality
+        jpeg_bytes = await encoder.encode(video_frame, edge, quality)
+
+        while len(jpeg_bytes) > self.max_image_bytes and (quality > MIN_JPEG_QUALITY or edge > MIN_EDGE):
+            if quality > MIN_JPEG_QUALITY:
+                quality = max(quality - QUALITY_STEP, MIN_JPEG_QUALITY)
+            else:
+                edge = max(int(edge * EDGE_STEP), MIN_EDGE)
+            jpeg_bytes = await encoder.encode(video_frame, edge, quality)
+
+        if len(jpeg_bytes) > self.max_image_bytes:
+            log_message("Frame is %s bytes at the smallest size allowed, over the %s byte limit", len(jpeg_bytes), self.max_image_bytes)
+        log_message("Frame fit to %s bytes at edge %s, quality %s", len(jpeg_bytes), edge, quality)
+
+        data_url = await encoder.data_url(video_frame, edge, quality)
+        return data_url, len(jpeg_bytes)
+
+    def _make_room(self, chat_ctx: ChatContext, needed: int) -> int:
+        """Drop the oldest images until needed more bytes fit in the request. Returns the total left."""
+        total = request_image_bytes(chat_ctx)
+        for msg in list(chat_ctx.messages):
+            if total + needed <= self.max_request_bytes:
+                break
+            if not isinstance(msg.content, list):
+                continue
+
+            kept = []
+            for content in msg.content:
+                if isinstance(content, ChatImage) and total + needed > self.max_request_bytes:
+                    size = image_bytes(content)
+                    total -= size
+                    self.images_dropped += 1
+                    self.bytes_saved += size
+                else:
+                    kept.append(content)
+            if kept:
+                msg.content = kept
+            else:
+                chat_ctx.messages.remove(msg)
+        return total
+
+    async def attach(self, chat_ctx: ChatContext, video_frame: rtc.VideoFrame, role: str = "user") -> dict:
+        """Append a frame to the chat context within the budget.
+
+        Returns metrics for the turn: the image's size, the images' total for the
+        request and, when debugging, the bytes saved against an unbudgeted
+        full-resolution encode.
+        """
+        data_url, size = await self.fit(video_frame)
+        total = self._make_room(chat_ctx, size) + size
+        chat_ctx.append(role=role, images=[ChatImage(image=data_url)])
+
+        self.images_sent += 1
+        self.bytes_sent += size
+        stats = {"image_bytes": size, "request_image_bytes": total}
+        if logger.DEBUG:
+            # costs an extra encode, so only measured when debugging
+            full_size = len(await get_frame_encoder().encode(
+                video_frame, max(video_frame.width, video_frame.height), self.quality
+            ))
+            stats["image_bytes_saved"] = full_size - size
+            self.bytes_saved += full_size - size
+        log_message("Attached frame to chat context: %s", stats)
+        return stats
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "images_sent": self.images_sent,
+            "images_dropped": self.images_dropped,
+            "bytes_sent": self.bytes_sent,
+            "bytes_saved": self.bytes_saved,
+        }
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import time
+
+import httpx
+from openai import AsyncOpenAI
+from livekit.plugins import openai
+
+from source.server.livekit.logger import log_message
+
+
+INTERPRETER_SERVER_HOST = os.getenv('INTERPRETER_SERVER_HOST', 'localhost')
+INTERPRETER_SERVER_PORT = os.getenv('INTERPRETER_SERVER_PORT', '8000')
+# Connections kept open to the interpreter server per worker process
+INTERPRETER_MAX_CONNECTIONS = int(os.getenv('01_INTERPRETER_MAX_CONNECTIONS', '4'))
+# The interpreter can go quiet for a long time while it runs code, so this is
+# the longest wait for the next chunk of a response, in seconds
+INTERPRETER_READ_TIMEOUT = float(os.getenv('01_INTERPRETER_READ_TIMEOUT', '300'))
+# Deadline of the warm-up request sent at job start, in seconds
+INTERPRETER_WARMUP_TIMEOUT = float(os.getenv('01_INTERPRETER_WARMUP_TIMEOUT', '30'))
+
+
+def interpreter_base_url(host: str = INTERPRETER_SERVER_HOST, port: str = INTERPRETER_SERVER_PORT) -> str:
+    return f"http://{host}:{port}/"
+
+
+class InterpreterClient:
+    """One pooled keep-alive connection to the Open Interpreter server per worker process.
+
+    The LLM plugin's own client would be rebuilt for every job, and it gives up
+    on a response after 5 s without a chunk, which is too short when the
+    interpreter is running code. warm_up() opens the connection and wakes the
+    server before the first turn needs it.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = None,
+        max_connections: int = INTERPRETER_MAX_CONNECTIONS,
+        read_timeout: float = INTERPRETER_READ_TIMEOUT,
+    ):
+        self.base_url = base_url or interpreter_base_url()
+        self.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=5.0),
+            follow_redirects=True,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=300,
+            ),
+        )
+        self.client = AsyncOpenAI(api_key="x", base_url=self.base_url, max_retries=0, http_client=self.http)
+
+        self.warm_up_s: float | None = None
+        self._warm_up_task: asyncio.Task | None = None
+
+    def llm(self) -> openai.LLM:
+        return openai.LLM(model="open-interpreter", client=self.client)
+
+    @property
+    def warm(self) -> bool:
+        return self.warm_up_s is not None
+
+    async def _warm_up(self):
+        start = time.perf_counter()
+        try:
+            # any response means the server is up and the connection is in the pool
+            await self.http.get(self.base_url, timeout=INTERPRETER_WARMUP_TIMEOUT)
+        except httpx.HTTPError as e:
+            log_message("Interpreter warm-up failed after %.0f ms: %s", (time.perf_counter() - start) * 1000, e)
+            return
+        self.warm_up_s = time.perf_counter() - start
+        log_message("Interpreter server warmed up in %.0f ms", self.warm_up_s * 1000)
+
+    def warm_up(self) -> asyncio.Task:
+        """Start warming up in the background, once per process."""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self._warm_up())
+        return self._warm_up_task
+
+    async def aclose(self):
+        if self._warm_up_task is not None:
+            self._warm_up_task.cancel()
+        await self.client.close()
+
+
+_interpreter_client: InterpreterClient | None = None
+
+
+def get_interpreter_client() -> InterpreterClient:
+    """The worker process's shared InterpreterClient."""
+    global _interpreter_client
+    if _interpreter_client is None:
+        _interpreter_client = InterpreterClient()
+    return _interpreter_client
@@ -0,0 +1,155 @@
+import asyncio
+import os
+import runpy
+import threading
+
+from livekit.agents import APIConnectionError, llm, utils
+from livekit.agents.llm import ChatContext, ChatImage, ChatMessage
+from livekit.agents.types import DEFAULT_API_CONNECT_OPTIONS, APIConnectOptions
+
+from source.server.livekit.context_compactor import CONTEXT_MAX_TOKENS, trim_lmc
+from source.server.livekit.logger import log_message
+
+
+# "server" talks to `interpreter --serve` over HTTP, "in-process" runs the
+# profile's Interpreter inside the worker's job process
+INTERPRETER_BACKEND = os.getenv('01_INTERPRETER_BACKEND', 'server').lower()
+INTERPRETER_PROFILE = os.getenv(
+    '01_INTERPRETER_PROFILE',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "profiles", "default.py"),
+)
+
+_DONE = object()
+
+
+def load_interpreter(profile: str = INTERPRETER_PROFILE):
+    """The Interpreter object a profile file sets up."""
+    return runpy.run_path(profile)["interpreter"]
+
+
+def to_lmc(messages: list[ChatMessage]) -> list[dict]:
+    """User messages in the interpreter's message format."""
+    lmc = []
+    for message in messages:
+        content = message.content if isinstance(message.content, list) else [message.content]
+        for part in content:
+            if isinstance(part, str) and part:
+                lmc.append({"role": "user", "type": "message", "content": part})
+            elif isinstance(part, ChatImage) and isinstance(part.image, str) and part.image.startswith("data:"):
+                # data:image/jpeg;base64,...
+                header, data = part.image.split(",", 1)
+                image_format = header[len("data:image/"):].split(";")[0]
+                lmc.append({"role": "user", "type": "image", "format": f"base64.{image_format}", "content": data})
+    return lmc
+
+
+class InterpreterLLM(llm.LLM):
+    """Open Interpreter as the agent's LLM, without the HTTP server in between.
+
+    The interpreter keeps its own conversation, so each request only hands it
+    the user messages added since the last assistant message. It is not
+    thread-safe and runs code as it answers, so requests are run one at a time
+    on a worker thread and are never retried.
+
+    That conversation is kept within max_tokens, the chat context's budget,
+    by dropping its oldest turns before each request, and reset() empties it
+    when the user clears the chat.
+    """
+
+    def __init__(self, interpreter=None, profile: str = INTERPRETER_PROFILE, max_tokens: int = CONTEXT_MAX_TOKENS):
+        super().__init__()
+        self.interpreter = interpreter if interpreter is not None else load_interpreter(profile)
+        self.max_tokens = max_tokens
+        self.lock = threading.Lock()
+        self._reset = threading.Event()
+        self.messages_dropped = 0
+
+    def reset(self):
+        """Forget the conversation before the next request, without waiting for one that is running."""
+        self._reset.set()
+
+    def _prepare(self):
+        """Apply a pending reset and trim the conversation. Called with the lock held."""
+        messages = self.interpreter.messages
+        if self._reset.is_set():
+            self._reset.clear()
+            log_message("Cleared %s messages of the in-process interpreter's conversation", len(messages))
+            messages.clear()
+        dropped = trim_lmc(messages, self.max_tokens)
+        if dropped:
+            self.messages_dropped += dropped
+            log_message("Dropped %s messages from the in-process interpreter's conversation", dropped)
+
+    def chat(
+        self,
+        *,
+        chat_ctx: ChatContext,
+        conn_options: APIConnectOptions = DEFAULT_API_CONNECT_OPTIONS,
+        fnc_ctx: llm.FunctionContext | None = None,
+        temperature: float | None = None,
+        n: int | None = None,
+        parallel_tool_calls: bool | None = None,
+        tool_choice=None,
+    ) -> "InterpreterLLMStream":
+        return InterpreterLLMStream(self, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, conn_options=conn_options)
+
+
+class InterpreterLLMStream(llm.LLMStream):
+    def __init__(self, llm: InterpreterLLM, *, chat_ctx: ChatContext, fnc_ctx, conn_options: APIConnectOptions):
+        super().__init__(llm, chat_ctx=chat_ctx, fnc_ctx=fnc_ctx, conn_options=conn_options)
+        self._interpreter_llm = llm
+
+    def _new_user_messages(self) -> list[ChatMessage]:
+        messages = []
+        for message in reversed(self._chat_ctx.messages):
+            if message.role != "user":
+                break
+            messages.append(message)
+        return messages[::-1]
+
+    def _produce(self, lmc: list[dict], loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, stop: threading.Event):
+        def _put(item):
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+        with self._interpreter_llm.lock:
+            try:
+                if stop.is_set():
+                    return
+                self._interpreter_llm._prepare()
+                chunks = self._interpreter_llm.interpreter.chat(lmc, stream=True, display=False)
+                try:
+                    for chunk in chunks:
+                        if stop.is_set():
+                            break
+                        # only the assistant's words are spoken, not its code or the code's output
+                        if chunk.get("role") == "assistant" and chunk.get("type") == "message" and chunk.get("content"):
+                            _put(chunk["content"])
+                finally:
+                    chunks.close()
+            except Exception as e:
+                _put(e)
+            finally:
+                _put(_DONE)
+
+    async def _run(self) -> None:
+        lmc = to_lmc(self._new_user_messages())
+        if not lmc:
+            return
+
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+        request_id = utils.shortuuid()
+        # the thread finishes in the background if the request is cancelled, and holds
+        # the interpreter until then so the next request can't interleave with it
+        loop.run_in_executor(None, self._produce, lmc, loop, queue, stop)
+        try:
+            while (item := await queue.get()) is not _DONE:
+                if isinstance(item, Exception):
+                    log_message("In-process interpreter failed: %s", item)
+                    raise APIConnectionError(f"interpreter failed: {item}", retryable=False) from item
+                self._event_ch.send_nowait(
+                    llm.ChatChunk(request_id=request_id, choices=[llm.Choice(delta=llm.ChoiceDelta(role="assistant", content=item))])
+                )
+        finally:
+            stop.set()
@@ -0,0 +1,109 @@
+import asyncio
+import atexit
+import threading
+import time
+from dataclasses import dataclass, field
+
+from source.server.livekit.logger import log_message
+
+
+@dataclass
+class Kernel:
+    interpreter: object
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def computer(self):
+        return self.interpreter.computer
+
+
+class KernelPool:
+    """The pre-started Python kernel of a multimodal job process.
+
+    The agents framework spawns a process per job and never gives it a second
+    one, so the pool holds a single kernel: fill() starts it from the
+    process' prewarm, before the job arrives, and the job leases it. Its
+    OpenInterpreter is the job's own, so sessions never share state, and a
+    released kernel is shut down rather than reset for reuse. A lease that
+    finds no kernel started (prewarm failed, or a second lease) starts one.
+    Kernel start and stop block, so they run on threads.
+    """
+
+    def __init__(self):
+        self._kernel: Kernel | None = None
+        self._running: list[Kernel] = []
+        self._lock = threading.Lock()
+
+        self.lease_wait: float | None = None
+        self.warm = False
+
+    def _start_kernel(self) -> Kernel:
+        from interpreter import OpenInterpreter
+
+        start = time.perf_counter()
+        interpreter = OpenInterpreter()
+        # the first run starts the Jupyter kernel
+        interpreter.computer.run("python", "pass")
+        log_message("Started Python kernel in %.0f ms", (time.perf_counter() - start) * 1000)
+        kernel = Kernel(interpreter)
+        self._running.append(kernel)
+        return kernel
+
+    def _stop_kernel(self, kernel: Kernel):
+        try:
+            kernel.computer.terminate()
+        except Exception as e:
+            log_message("Failed to stop Python kernel: %s", e)
+        if kernel in self._running:
+            self._running.remove(kernel)
+
+    def fill(self):
+        """Start the kernel if it isn't running yet. Blocks."""
+        with self._lock:
+            if self._kernel is None:
+                self._kernel = self._start_kernel()
+
+    def _take(self) -> tuple[Kernel, bool]:
+        with self._lock:
+            kernel, self._kernel = self._kernel, None
+            if kernel is not None:
+                return kernel, True
+            return self._start_kernel(), False
+
+    async def lease(self) -> Kernel:
+        """Take the pre-started kernel for the job, starting one if there is none."""
+        start = time.perf_counter()
+        kernel, self.warm = await asyncio.to_thread(self._take)
+        self.lease_wait = time.perf_counter() - start
+        log_message("Leased %s Python kernel after %.0f ms", "a warm" if self.warm else "a new", self.lease_wait * 1000)
+        return kernel
+
+    async def release(self, kernel: Kernel):
+        """Shut down a leased kernel, its process has no other job to run."""
+        await asyncio.to_thread(self._stop_kernel, kernel)
+
+    def close(self):
+        """Shut down every kernel still running."""
+        with self._lock:
+            self._kernel = None
+        for kernel in list(self._running):
+            self._stop_kernel(kernel)
+
+    def stats(self) -> dict:
+        return {
+            "warm": self.warm,
+            "lease_wait_ms": round(self.lease_wait * 1000, 1) if self.lease_wait is not None else None,
+        }
+
+
+_kernel_pool: KernelPool | None = None
+
+
+def get_kernel_pool() -> KernelPool:
+    """The job process's shared KernelPool."""
+    global _kernel_pool
+    if _kernel_pool is None:
+        _kernel_pool = KernelPool()
+        # Jupyter kernels are separate processes, don't leave them behind
+        atexit.register(_kernel_pool.close)
+    return _kernel_pool
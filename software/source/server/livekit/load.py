@@ -0,0 +1,282 @@
+import asyncio
+import atexit
+import json
+import math
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import psutil
+from livekit.agents import llm
+from livekit.agents.types import APIConnectOptions
+from livekit.agents.worker import _WorkerEnvOption
+
+from source.server.livekit.logger import log_message
+from source.server.livekit.sessions import MAX_SESSIONS
+
+
+# Load above which the worker stops accepting jobs. CPU use and RSS are
+# compared to it directly, sessions and in-flight calls reach it at their limits.
+# Unless it is set, it only applies outside dev mode, like the agents' own default
+LOAD_THRESHOLD = float(os.getenv('01_LOAD_THRESHOLD', '0.75'))
+# LLM, vision and code calls in flight across all of the worker's jobs at full load
+LOAD_MAX_IN_FLIGHT = int(os.getenv('01_LOAD_MAX_IN_FLIGHT', '16'))
+# RSS of the worker and its job processes at full load, defaults to the host's memory
+LOAD_MAX_RSS_MB = float(os.getenv('01_LOAD_MAX_RSS_MB', '0')) or psutil.virtual_memory().total / (1024 * 1024)
+
+# Job processes publish their in-flight calls here, one file per process
+IN_FLIGHT_DIR = os.path.join(tempfile.gettempdir(), '01-load')
+# Seconds between writes of a job process's counts, changes in between are coalesced
+IN_FLIGHT_PUBLISH_INTERVAL = 0.5
+
+
+class InFlightCalls:
+    """Counts a job process's in-flight calls and publishes them for the worker.
+
+    Jobs run in their own processes while the load is computed in the worker's,
+    so the counts are written to a small file named after the job's pid.
+    Changes only mark the counts dirty. A writer thread publishes them at most
+    every IN_FLIGHT_PUBLISH_INTERVAL, so the event loop never touches the disk.
+    close() removes the file.
+    """
+
+    def __init__(self, directory: str = IN_FLIGHT_DIR, interval: float = IN_FLIGHT_PUBLISH_INTERVAL):
+        self.path = os.path.join(directory, str(os.getpid()))
+        self.interval = interval
+        self.counts: Counter[str] = Counter()
+        self.writes = 0
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # held by the writer thread while it writes, so close() can't race it
+        self._write_lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._closed = False
+        self._writer = threading.Thread(target=self._publish_loop, name="in-flight-writer", daemon=True)
+        self._writer.start()
+
+    def _change(self, kind: str, delta: int):
+        with self._lock:
+            self.counts[kind] += delta
+        self._dirty.set()
+
+    def _publish(self):
+        with self._lock:
+            data = json.dumps(self.counts)
+        with self._write_lock:
+            if self._closed:
+                return
+            tmp_path = f"{self.path}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    f.write(data)
+                os.replace(tmp_path, self.path)
+                self.writes += 1
+            except OSError as e:
+                log_message("Failed to publish in-flight calls: %s", e)
+
+    def _publish_loop(self):
+        while not self._closed:
+            self._dirty.wait()
+            self._dirty.clear()
+            self._publish()
+            # changes made meanwhile are published together by the next write
+            time.sleep(self.interval)
+
+    def track(self, kind: str, task: asyncio.Future):
+        """Count a call until its task is done."""
+        self._change(kind, 1)
+        task.add_done_callback(lambda _: self._change(kind, -1))
+
+    @contextmanager
+    def running(self, kind: str):
+        """Count a call for the duration of the block."""
+        self._change(kind, 1)
+        try:
+            yield
+        finally:
+            self._change(kind, -1)
+
+    def close(self):
+        """Stop publishing and remove the file."""
+        with self._write_lock:
+            self._closed = True
+            for path in (self.path, f"{self.path}.tmp"):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    log_message("Failed to remove in-flight calls file: %s", e)
+        self._dirty.set()
+
+
+_in_flight: InFlightCalls | None = None
+
+
+def worker_load_threshold() -> float | _WorkerEnvOption[float]:
+    """The load_threshold for WorkerOptions.
+
+    The workers run in dev mode, usually the only worker on a machine that
+    does other things. Host-wide CPU use would then mark it full and leave
+    nobody to take jobs, so the threshold is off in dev mode unless
+    01_LOAD_THRESHOLD asks for it.
+    """
+    if os.getenv('01_LOAD_THRESHOLD'):
+        return LOAD_THRESHOLD
+    return _WorkerEnvOption(dev_default=math.inf, prod_default=LOAD_THRESHOLD)
+
+
+def get_in_flight() -> InFlightCalls:
+    """The job process's shared InFlightCalls."""
+    global _in_flight
+    if _in_flight is None:
+        _in_flight = InFlightCalls()
+        # don't leave the file behind for the worker to count
+        atexit.register(_in_flight.close)
+    return _in_flight
+
+
+class TrackedLLMStream(llm.LLMStream):
+    """Forwards another LLMStream, counted as an in-flight call until it ends.
+
+    The count goes up when the stream is created and down when it finishes,
+    fails or is closed. Metrics and function calls are the wrapped stream's.
+    """
+
+    def __init__(self, llm_: llm.LLM, stream: llm.LLMStream, kind: str = "llm"):
+        self._stream = stream
+        # the wrapped stream does any retrying
+        super().__init__(llm_, chat_ctx=stream.chat_ctx, fnc_ctx=stream.fnc_ctx, conn_options=APIConnectOptions(max_retry=0))
+        get_in_flight().track(kind, self._task)
+
+    async def _run(self) -> None:
+        try:
+            async for chunk in self._stream:
+                self._event_ch.send_nowait(chunk)
+        finally:
+            await self._stream.aclose()
+
+    async def _metrics_monitor_task(self, event_aiter) -> None:
+        # the wrapped stream already reports the request's metrics
+        async for _ in event_aiter:
+            pass
+
+    @property
+    def function_calls(self) -> list[llm.FunctionCallInfo]:
+        return self._stream.function_calls
+
+    def execute_functions(self) -> list[llm.CalledFunction]:
+        return self._stream.execute_functions()
+
+    async def aclose(self) -> None:
+        await super().aclose()
+        # in case it was closed before it ran
+        await self._stream.aclose()
+
+
+class WorkerLoad:
+    """psutil based load of a worker and its job processes, for dispatch.
+
+    The load is the highest of:
+    - host CPU use
+    - RSS of the worker and its jobs over LOAD_MAX_RSS_MB
+    - active jobs over MAX_SESSIONS
+    - LLM, vision and code calls in flight over LOAD_MAX_IN_FLIGHT
+    with the last two scaled so that their limits land on the threshold.
+    """
+
+    def __init__(
+        self,
+        threshold: float = LOAD_THRESHOLD,
+        max_sessions: int = MAX_SESSIONS,
+        max_in_flight: int = LOAD_MAX_IN_FLIGHT,
+        max_rss_mb: float = LOAD_MAX_RSS_MB,
+        directory: str = IN_FLIGHT_DIR,
+    ):
+        self.threshold = threshold
+        self.max_sessions = max_sessions
+        self.max_in_flight = max_in_flight
+        self.max_rss_mb = max_rss_mb
+        self.directory = directory
+
+        self._process = psutil.Process()
+        self.components: dict[str, float] = {}
+        self.in_flight: Counter[str] = Counter()
+        # pid -> (mtime, counts), a file is only read again once it changed
+        self._files: dict[int, tuple[int, Counter[str]]] = {}
+        self.full = False
+        # the first reading of cpu_percent(None) is meaningless
+        psutil.cpu_percent(interval=None)
+
+    def _read_in_flight(self, pids: set[int]) -> Counter[str]:
+        counts = Counter()
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return counts
+        for name in names:
+            if not name.isdigit():
+                continue
+            pid, path = int(name), os.path.join(self.directory, name)
+            if pid not in pids:
+                # left behind by a job process that has exited, possibly another worker's
+                if not psutil.pid_exists(pid):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                continue
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                cached = self._files.get(pid)
+                if cached is None or cached[0] != mtime:
+                    with open(path) as f:
+                        cached = (mtime, Counter(json.load(f)))
+                    self._files[pid] = cached
+            except (OSError, ValueError):
+                continue
+            counts.update(cached[1])
+        # forget the processes that have gone
+        for pid in self._files.keys() - pids:
+            del self._files[pid]
+        return counts
+
+    def _tree_rss(self) -> tuple[float, set[int]]:
+        rss = self._process.memory_info().rss
+        pids = set()
+        for child in self._process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+                pids.add(child.pid)
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return rss / (1024 * 1024), pids
+
+    def measure(self, active_jobs: int) -> float:
+        rss_mb, pids = self._tree_rss()
+        self.in_flight = self._read_in_flight(pids)
+        self.components = {
+            "cpu": psutil.cpu_percent(interval=None) / 100,
+            "rss": rss_mb / self.max_rss_mb,
+            "sessions": active_jobs / self.max_sessions * self.threshold,
+            "in_flight": sum(self.in_flight.values()) / self.max_in_flight * self.threshold,
+        }
+        load = min(max(self.components.values()), 1.0)
+
+        full = load >= self.threshold
+        if full != self.full:
+            self.full = full
+            log_message(
+                "Worker load %.2f %s the %.2f threshold: %s (%s)",
+                load, "reached" if full else "back under", self.threshold,
+                {name: round(value, 2) for name, value in self.components.items()}, dict(self.in_flight),
+            )
+        return load
+
+    def __call__(self, worker) -> float:
+        # runs on a thread of the worker process every few seconds
+        return self.measure(len(worker.active_jobs))
@@ -1,14 +1,248 @@
+import atexit
+import json
 import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # Define the path to the log file
 LOG_FILE_PATH = 'worker.txt'
 DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
 
-def log_message(message: str):
-    """Append a message to the log file with a timestamp."""
+# "text" for the classic "timestamp - message" lines, "json" for one JSON object per line
+LOG_FORMAT = os.getenv('01_LOG_FORMAT', 'text').lower()
+# Rotate the log file once it grows past this size, keeping LOG_BACKUP_COUNT old files
+LOG_MAX_BYTES = int(os.getenv('01_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+LOG_BACKUP_COUNT = int(os.getenv('01_LOG_BACKUP_COUNT', '3'))
+# How long the writer waits to batch records together before flushing
+LOG_FLUSH_INTERVAL = 0.2
+LOG_BATCH_SIZE = 512
+# Records queued for a writer at most; beyond that they are dropped and counted
+LOG_QUEUE_SIZE = 10000
+# Seconds between reports of a failing writer on stderr
+LOG_ERROR_REPORT_INTERVAL = 60.0
+
+
+@contextmanager
+def _rotation_lock(path: str):
+    """Held while rotating path, since every job process writes to the same log file."""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path}.lock", 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _snapshot(arg):
+    """Shallow copy of a mutable log argument, so the line shows it as it was when logged."""
+    if isinstance(arg, (str, int, float, bytes)) or arg is None:
+        return arg
+    if isinstance(arg, (list, dict, set)):
+        return arg.copy()
+    # only when DEBUG is on, by which time the agents are long imported
+    from livekit.agents.llm import ChatContext
+    if isinstance(arg, ChatContext):
+        return arg.copy()
+    return arg
+
+
+class _LogWriter(threading.Thread):
+    """Background thread that owns a log file.
+
+    Records are handed over through a queue so callers on the event loop never
+    touch the disk. The writer drains whatever has queued up, writes it in one
+    go and rotates the file by size.
+
+    The queue is bounded: records that don't fit are dropped and counted, and
+    the count is written once there is room again. A batch that fails to
+    format or write is reported on stderr and the writer carries on.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path: str, log_format: str | None = None):
+        super().__init__(name=f"log-writer:{path}", daemon=True)
+        self.path = path
+        self.log_format = log_format or LOG_FORMAT
+        self.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._file = None
+
+        self.dropped = 0
+        self.failed = 0
+        self._reported_dropped = 0
+        self._last_error_report = float('-inf')
+
+    def put(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            try:
+                batch = [self.queue.get(timeout=LOG_FLUSH_INTERVAL)]
+            except queue.Empty:
+                continue
+
+            while len(batch) < LOG_BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            # records queued after the stop are still written
+            stopping = any(record is self._STOP for record in batch)
+            records = [record for record in batch if record is not self._STOP]
+            try:
+                self._write_batch(records)
+            except Exception as e:
+                self.failed += len(records)
+                self._report_error(e)
+                self._close_file()
+
+        self._close_file()
+
+    def _write_batch(self, records: list):
+        lines = [self._format(record) for record in records]
+        dropped = self.dropped
+        if dropped > self._reported_dropped:
+            lines.append(self._format((time.time(), "%s log records dropped, the queue was full", (dropped - self._reported_dropped,), {})))
+            self._reported_dropped = dropped
+        if lines:
+            self._write("".join(lines))
+
+    def _report_error(self, error: Exception):
+        now = time.monotonic()
+        if now - self._last_error_report < LOG_ERROR_REPORT_INTERVAL:
+            return
+        self._last_error_report = now
+        print(f"log writer for {self.path} failed, {self.failed} records lost so far: {error!r}", file=sys.stderr)
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def stop(self, timeout: float = 2.0):
+        try:
+            self.queue.put(self._STOP, timeout=timeout)
+        except queue.Full:
+            return
+        self.join(timeout)
+
+    def _format(self, record) -> str:
+        created, message, args, fields = record
+        if args:
+            # formatted here rather than by the caller, which is usually the event loop
+            try:
+                message = message % args
+            except (TypeError, ValueError) as e:
+                message = f"{message} {args!r} ({e})"
+        if self.log_format == 'json':
+            return json.dumps({"ts": created, "log": self.path, "msg": message, **fields}, default=str) + "\n"
+
+        timestamp = datetime.fromtimestamp(created).strftime('%Y-%m-%d %H:%M:%S')
+        if fields:
+            message = f"{message} {json.dumps(fields, default=str)}"
+        return f"{timestamp} - {message}\n"
+
+    def _write(self, data: str):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(data)
+        self._file.flush()
+
+        if LOG_MAX_BYTES and self._file.tell() >= LOG_MAX_BYTES:
+            self._rotate()
+
+    def _rotate(self):
+        with _rotation_lock(self.path):
+            # another process may have rotated the file since this one opened it
+            opened = os.fstat(self._file.fileno())
+            self._close_file()
+            try:
+                current = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if (current.st_dev, current.st_ino) != (opened.st_dev, opened.st_ino) or current.st_size < LOG_MAX_BYTES:
+                return
+
+            for i in range(LOG_BACKUP_COUNT - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{i}"):
+                    os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+            if LOG_BACKUP_COUNT > 0:
+                os.replace(self.path, f"{self.path}.1")
+            else:
+                os.remove(self.path)
+
+
+_writers: dict[str, _LogWriter] = {}
+_writers_pid = os.getpid()
+_writers_lock = threading.Lock()
+
+
+def _get_writer(path: str, log_format: str | None = None) -> _LogWriter:
+    global _writers, _writers_pid
+    writer = _writers.get(path)
+    if writer is not None and _writers_pid == os.getpid():
+        return writer
+
+    with _writers_lock:
+        # writer threads do not survive a fork, job processes start their own
+        if _writers_pid != os.getpid():
+            _writers = {}
+            _writers_pid = os.getpid()
+        if path not in _writers:
+            writer = _LogWriter(path, log_format)
+            writer.start()
+            _writers[path] = writer
+        return _writers[path]
+
+
+@atexit.register
+def flush_logs():
+    """Write out everything still queued and stop the writer threads."""
+    if _writers_pid != os.getpid():
+        return
+    for writer in list(_writers.values()):
+        writer.stop()
+    _writers.clear()
+
+
+def log_message(message: str, *args, path: str = LOG_FILE_PATH, log_format: str | None = None, **fields):
+    """Queue a message for the log file with a timestamp.
+
+    The message is only %-formatted with args when DEBUG is on, and then by the
+    writer thread, so pass anything expensive to stringify (chat contexts,
+    responses) as args instead of building an f-string. Extra keyword fields
+    end up as keys in JSON lines.
+    """
     if not DEBUG:
         return
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with open(LOG_FILE_PATH, 'a') as log_file:
-        log_file.write(f"{timestamp} - {message}\n")
+    # mutable args are formatted later on the writer thread, copy them as they are now
+    args = tuple(_snapshot(arg) for arg in args)
+    _get_writer(path, log_format).put((time.time(), message, args, fields))
+
+
+def get_logger(path: str, log_format: str | None = None):
+    """Return a log_message bound to another log file (and optionally a fixed format)."""
+    def _log_message(message: str, *args, **fields):
+        log_message(message, *args, path=path, log_format=log_format, **fields)
+    return _log_message
@@ -3,17 +3,24 @@ import sys
 from livekit.agents import (
     AutoSubscribe,
     JobContext,
+    JobProcess,
     WorkerOptions,
     cli,
     llm,
 )
 from livekit.agents.multimodal import MultimodalAgent
+from livekit import rtc
 from livekit.plugins import openai
 from dotenv import load_dotenv
 import os
 import time
 from typing import Annotated
 from livekit.agents import llm
+from source.server.livekit.sessions import is_session_room
+from source.server.livekit.load import WorkerLoad, get_in_flight, worker_load_threshold
+from source.server.livekit.code_runner import CODE_OUTPUT_TOPIC, CodeRunner
+from source.server.livekit.kernel_pool import get_kernel_pool
+from source.server.livekit.logger import log_message
 
 # Set the environment variable
 os.environ['INTERPRETER_TERMINAL_INPUT_PATIENCE'] = '200000'
@@ -34,29 +41,50 @@ You MUST remember to pass into the execute_code function a correct JSON input li
 
 load_dotenv()
 
+# Worker processes kept initialized, with their kernels running, ahead of jobs
+NUM_IDLE_PROCESSES = int(os.getenv('01_NUM_IDLE_PROCESSES', '1'))
+# Starting the pool's kernels takes longer than the agents' default of 10 s
+PREWARM_TIMEOUT = float(os.getenv('01_PREWARM_TIMEOUT', '60'))
+
+
+def prewarm(proc: JobProcess):
+    """Start the Python kernel before the process gets a job, so the first tool call finds it running"""
+    start = time.perf_counter()
+    get_kernel_pool().fill()
+    log_message("Prewarmed Python kernel in %.0f ms", (time.perf_counter() - start) * 1000)
+
+
 async def entrypoint(ctx: JobContext):
-    
-    from interpreter import interpreter
+    # the kernel prewarm started, this session's own and shut down when it ends
+    kernel_pool = get_kernel_pool()
+    kernel = await kernel_pool.lease()
+
+    async def _publish_code_output(payload: str):
+        await ctx.room.local_participant.publish_data(payload=payload, topic=CODE_OUTPUT_TOPIC)
 
-    def execute_code(code):
+    # runs code on its own thread so the realtime audio keeps flowing
+    code_runner = CodeRunner(kernel.computer, publish=_publish_code_output)
+
+    async def _close_code_runner():
+        code_runner.aclose()
+        await kernel_pool.release(kernel)
+        log_message("kernel pool: %s", kernel_pool.stats())
+
+    ctx.add_shutdown_callback(_close_code_runner)
+
+    async def execute_code(code):
         print("--- code ---")
         print(code)
         print("---")
-        #time.sleep(2)
         # Check if the code contains any file deletion commands
         if any(keyword in code.lower() for keyword in ['os.remove', 'os.unlink', 'shutil.rmtree', 'delete file', 'rm -']):
             print("Warning: File deletion commands detected. Execution aborted for safety.")
             return "Execution aborted: File deletion commands are not allowed."
+        output = await code_runner.run(code)
         print("--- output ---")
-        output = ""
-        for chunk in interpreter.computer.run("python", code):
-            if "content" in chunk and type(chunk["content"]) == str:
-                output += "\n" + chunk["content"]
-                print(chunk["content"])
+        print(output)
         print("---")
 
-        output = output.strip()
-        
         if output == "":
             output = "No output was produced by running this code."
         return output
@@ -75,7 +103,8 @@ async def entrypoint(ctx: JobContext):
             ],
         ):
             """Executes Python and returns the output"""
-            return execute_code(code)
+            with get_in_flight().running("code"):
+                return await execute_code(code)
 
     fnc_ctx = AssistantFnc()
 
@@ -83,6 +112,12 @@ async def entrypoint(ctx: JobContext):
 
     participant = await ctx.wait_for_participant()
 
+    @ctx.room.on("participant_disconnected")
+    def on_participant_disconnected(participant: rtc.RemoteParticipant):
+        # a session room has a single user, end the job and free its slot once they leave
+        if is_session_room(ctx.room.name) and not ctx.room.remote_participants:
+            ctx.shutdown(reason="session user left")
+
     openai_api_key = os.getenv("OPENAI_API_KEY")
     model = openai.realtime.RealtimeModel(
         instructions=instructions,
@@ -125,5 +160,17 @@ def main(livekit_url):
 
     # Initialize the worker with the entrypoint
     cli.run_app(
-        WorkerOptions(entrypoint_fnc=entrypoint, api_key="devkey", api_secret="secret", ws_url=livekit_url, port=8082)
+        WorkerOptions(
+            entrypoint_fnc=entrypoint,
+            prewarm_fnc=prewarm,
+            num_idle_processes=NUM_IDLE_PROCESSES,
+            initialize_process_timeout=PREWARM_TIMEOUT,
+            api_key="devkey",
+            api_secret="secret",
+            ws_url=livekit_url,
+            port=8082,
+            # stop taking jobs when busy so the server dispatches them to other workers
+            load_fnc=WorkerLoad(),
+            load_threshold=worker_load_threshold(),
+        )
     )
\ No newline at end of file
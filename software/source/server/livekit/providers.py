@@ -0,0 +1,203 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Callable
+
+from livekit.agents import metrics, stt, tokenize, tts, utils
+from livekit.plugins import deepgram, openai, silero, elevenlabs, cartesia
+
+from source.server.livekit.logger import log_message
+from source.server.livekit.tracing import percentile
+
+
+# Comma-separated providers in order of preference, e.g. 01_TTS=elevenlabs,local
+TTS_PROVIDERS = os.getenv('01_TTS', 'elevenlabs')
+STT_PROVIDERS = os.getenv('01_STT', 'deepgram')
+# Latency SLOs: a TTS attempt with no audio after this long, or an STT request
+# taking longer, fails over to the next provider
+TTS_SLO_MS = float(os.getenv('01_TTS_SLO_MS', '2000'))
+STT_SLO_MS = float(os.getenv('01_STT_SLO_MS', '5000'))
+# A provider that failed is retried in the background this often
+PROVIDER_RETRY_INTERVAL = float(os.getenv('01_PROVIDER_RETRY_INTERVAL', '5'))
+
+LOCAL_TTS_URL = os.getenv('01_LOCAL_TTS_URL', 'http://localhost:9001/v1')
+LOCAL_STT_URL = os.getenv('01_LOCAL_STT_URL', 'http://localhost:9002/v1')
+
+# Requests each provider's rolling latency and error rate are computed over
+STATS_WINDOW = 50
+
+TTS_FACTORIES: dict[str, Callable[[], tts.TTS]] = {
+    'openai': lambda: openai.TTS(),
+    'local': lambda: openai.TTS(base_url=LOCAL_TTS_URL),
+    'elevenlabs': lambda: elevenlabs.TTS(),
+    'cartesia': lambda: cartesia.TTS(),
+}
+
+STT_FACTORIES: dict[str, Callable[[], stt.STT]] = {
+    'deepgram': lambda: deepgram.STT(),
+    'local': lambda: openai.STT(base_url=LOCAL_STT_URL),
+}
+
+
+def parse_providers(value: str) -> list[str]:
+    return [name.strip().lower() for name in value.split(',') if name.strip()]
+
+
+class ProviderStats:
+    """Rolling latency and error rate of one provider."""
+
+    def __init__(self, name: str, window: int = STATS_WINDOW):
+        self.name = name
+        self.latencies: deque[float] = deque(maxlen=window)
+        self.outcomes: deque[bool] = deque(maxlen=window)
+        self.available = True
+
+    def record(self, latency: float | None, error: bool = False):
+        if latency is not None and latency >= 0:
+            self.latencies.append(latency)
+        self.outcomes.append(error)
+
+    def summary(self) -> dict:
+        latencies = list(self.latencies)
+        return {
+            "available": self.available,
+            "requests": len(self.outcomes),
+            "error_rate": round(sum(self.outcomes) / len(self.outcomes), 2) if self.outcomes else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            "p90_ms": round(percentile(latencies, 90) * 1000, 1) if latencies else None,
+        }
+
+
+class ProviderRegistry:
+    """Builds the STT and TTS from config, warms them up and tracks how each provider is doing.
+
+    With more than one provider configured, they are combined with the agents'
+    FallbackAdapter. A provider that errors or misses its latency SLO is
+    skipped for the next one, and put back once a background retry succeeds.
+    Latency comes from each provider's own metrics: time to first byte for TTS
+    and request duration for STT.
+    """
+
+    def __init__(
+        self,
+        vad: silero.VAD,
+        tts_providers: str = TTS_PROVIDERS,
+        stt_providers: str = STT_PROVIDERS,
+        tts_slo_ms: float = TTS_SLO_MS,
+        stt_slo_ms: float = STT_SLO_MS,
+    ):
+        self.vad = vad
+        self.tts_names = parse_providers(tts_providers)
+        self.stt_names = parse_providers(stt_providers)
+        self.tts_slo_ms = tts_slo_ms
+        self.stt_slo_ms = stt_slo_ms
+
+        self.stats: dict[str, ProviderStats] = {}
+        self._providers: dict[int, str] = {}
+        self._instances: list[tuple[str, tts.TTS | stt.STT]] = []
+        self.tts: tts.TTS = self._build_tts()
+        self.stt: stt.STT = self._build_stt()
+
+    def _track(self, kind: str, name: str, provider: tts.TTS | stt.STT):
+        key = f"{kind}:{name}"
+        self.stats[key] = ProviderStats(key)
+        self._providers[id(provider)] = key
+        self._instances.append((key, provider))
+
+        @provider.on("metrics_collected")
+        def _on_metrics(mtrcs):
+            if isinstance(mtrcs, metrics.TTSMetrics):
+                # a request that ended without audio and wasn't cancelled failed
+                failed = mtrcs.error is not None or (mtrcs.ttfb < 0 and not mtrcs.cancelled)
+                self.stats[key].record(mtrcs.ttfb, failed)
+            elif isinstance(mtrcs, metrics.STTMetrics):
+                self.stats[key].record(mtrcs.duration, mtrcs.error is not None)
+
+    def _on_availability_changed(self, ev):
+        provider = getattr(ev, 'tts', None) or getattr(ev, 'stt', None)
+        key = self._providers.get(id(provider), getattr(provider, 'label', '?'))
+        if key in self.stats:
+            self.stats[key].available = ev.available
+        log_message("Provider %s is now %s", key, "available" if ev.available else "unavailable, failing over")
+
+    def _build_tts(self) -> tts.TTS:
+        providers = []
+        for name in self.tts_names:
+            if name not in TTS_FACTORIES:
+                raise ValueError(f"Unsupported TTS provider: {name}. Please set 01_TTS environment variable to one or more of {', '.join(TTS_FACTORIES)}.")
+            provider = TTS_FACTORIES[name]()
+            self._track("tts", name, provider)
+            providers.append(provider)
+        print(f"using {', '.join(self.tts_names)} tts")
+
+        if len(providers) == 1:
+            return providers[0]
+
+        # keep streaming providers streaming by giving the others the agent's sentence splitting
+        if any(p.capabilities.streaming for p in providers):
+            providers = [
+                p if p.capabilities.streaming else tts.StreamAdapter(tts=p, sentence_tokenizer=tokenize.basic.SentenceTokenizer())
+                for p in providers
+            ]
+            for adapter, name in zip(providers, self.tts_names):
+                self._providers.setdefault(id(adapter), f"tts:{name}")
+
+        adapter = tts.FallbackAdapter(
+            providers,
+            attempt_timeout=self.tts_slo_ms / 1000,
+            retry_interval=PROVIDER_RETRY_INTERVAL,
+        )
+        adapter.on("tts_availability_changed", self._on_availability_changed)
+        return adapter
+
+    def _build_stt(self) -> stt.STT:
+        providers = []
+        for name in self.stt_names:
+            if name not in STT_FACTORIES:
+                raise ValueError(f"Unsupported STT provider: {name}. Please set 01_STT environment variable to one or more of {', '.join(STT_FACTORIES)}.")
+            provider = STT_FACTORIES[name]()
+            self._track("stt", name, provider)
+            providers.append(provider)
+        print(f"using {', '.join(self.stt_names)} stt")
+
+        if len(providers) == 1:
+            return providers[0]
+
+        # the fallback adapter only takes streaming STT, non-streaming ones are segmented by VAD
+        providers = [p if p.capabilities.streaming else stt.StreamAdapter(stt=p, vad=self.vad) for p in providers]
+        for adapter, name in zip(providers, self.stt_names):
+            self._providers.setdefault(id(adapter), f"stt:{name}")
+
+        adapter = stt.FallbackAdapter(
+            providers,
+            attempt_timeout=self.stt_slo_ms / 1000,
+            retry_interval=PROVIDER_RETRY_INTERVAL,
+        )
+        adapter.on("stt_availability_changed", self._on_availability_changed)
+        return adapter
+
+    async def _warm(self, key: str, provider: tts.TTS | stt.STT):
+        start = time.perf_counter()
+        try:
+            if isinstance(provider, tts.TTS) and type(provider).prewarm is not tts.TTS.prewarm:
+                provider.prewarm()
+            elif hasattr(provider, "_client"):
+                # opens a keep-alive connection in the OpenAI client's pool; any response will do
+                await provider._client.with_options(timeout=2.0, max_retries=0).models.list()
+            else:
+                url = getattr(getattr(provider, "_opts", None), "base_url", None) or getattr(provider, "_base_url", None)
+                if url:
+                    async with utils.http_context.http_session().head(url, timeout=2.0):
+                        pass
+        except Exception as e:
+            # an error response still leaves the connection open
+            log_message("Warming %s: %s", key, e)
+        log_message("Warmed %s in %.0f ms", key, (time.perf_counter() - start) * 1000)
+
+    async def prewarm(self):
+        """Open connections to every configured provider before the first turn."""
+        await asyncio.gather(*(self._warm(key, provider) for key, provider in self._instances))
+
+    def summary(self) -> dict[str, dict]:
+        return {key: stats.summary() for key, stats in self.stats.items()}
@@ -0,0 +1,245 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from urllib.parse import quote
+
+from aiohttp import web
+from livekit import api
+from livekit.agents import utils
+
+from source.server.livekit.logger import log_message
+
+
+# Sessions served at once: the session endpoint stops minting tokens and each
+# worker reports itself full once it runs this many jobs
+MAX_SESSIONS = int(os.getenv('01_MAX_SESSIONS', '8'))
+SESSION_HOST = os.getenv('01_SESSION_HOST', '0.0.0.0')
+SESSION_PORT = int(os.getenv('01_SESSION_PORT', '10102'))
+# Every session gets its own room, named with this prefix
+SESSION_ROOM_PREFIX = 'session-'
+# A minted session holds its slot this long while waiting for the user to join
+SESSION_JOIN_TIMEOUT = float(os.getenv('01_SESSION_JOIN_TIMEOUT', '60'))
+SESSION_TOKEN_TTL = float(os.getenv('01_SESSION_TOKEN_TTL', str(6 * 60 * 60)))
+
+
+class SessionServerError(Exception):
+    pass
+
+
+def is_session_room(room_name: str) -> bool:
+    return room_name.startswith(SESSION_ROOM_PREFIX)
+
+
+@dataclass
+class Session:
+    room: str
+    identity: str
+    token: str
+    created_at: float
+    joined: bool = False
+
+
+class SessionManager:
+    """Mints a room and participant token per session and keeps count of the live ones.
+
+    A session is live from when its token is minted until its user has joined
+    and left again, or until SESSION_JOIN_TIMEOUT passes without them joining.
+    Occupancy comes from the LiveKit server's room list.
+    """
+
+    def __init__(
+        self,
+        livekit_url: str,
+        api_key: str,
+        api_secret: str,
+        max_sessions: int = MAX_SESSIONS,
+        join_timeout: float = SESSION_JOIN_TIMEOUT,
+    ):
+        self.livekit_url = livekit_url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.max_sessions = max_sessions
+        self.join_timeout = join_timeout
+
+        self.sessions: dict[str, Session] = {}
+        self.minted = 0
+        self.rejected = 0
+        self._api: api.LiveKitAPI | None = None
+        self._lock: asyncio.Lock | None = None
+
+    async def refresh(self) -> list[Session]:
+        """Drop the sessions that have ended and return the live ones."""
+        if not self.sessions:
+            return []
+        if self._api is None:
+            self._api = api.LiveKitAPI(self.livekit_url, self.api_key, self.api_secret)
+
+        try:
+            rooms = await self._api.room.list_rooms(api.ListRoomsRequest(names=list(self.sessions)))
+            occupied = {room.name for room in rooms.rooms if room.num_participants > 0}
+        except Exception as e:
+            # keep counting every session rather than let the limit lapse
+            log_message("Failed to list session rooms: %s", e)
+            return list(self.sessions.values())
+
+        now = time.monotonic()
+        for name, session in list(self.sessions.items()):
+            if name in occupied:
+                session.joined = True
+            elif session.joined or now - session.created_at > self.join_timeout:
+                del self.sessions[name]
+                log_message("Session %s ended", name)
+        return list(self.sessions.values())
+
+    async def mint(self, name: str = "You") -> Session | None:
+        """A new room and token, or None when MAX_SESSIONS are already live."""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if len(await self.refresh()) >= self.max_sessions:
+                self.rejected += 1
+                return None
+
+            room = f"{SESSION_ROOM_PREFIX}{utils.shortuuid()}"
+            identity = f"user-{utils.shortuuid()}"
+            token = (
+                api.AccessToken(self.api_key, self.api_secret)
+                .with_identity(identity)
+                .with_name(name)
+                .with_ttl(timedelta(seconds=SESSION_TOKEN_TTL))
+                .with_grants(api.VideoGrants(room_join=True, room=room))
+                .to_jwt()
+            )
+            session = Session(room=room, identity=identity, token=token, created_at=time.monotonic())
+            self.sessions[room] = session
+            self.minted += 1
+            log_message("Minted session %s for %s", room, identity)
+            return session
+
+    def stats(self) -> dict:
+        return {
+            "live": len(self.sessions),
+            "max_sessions": self.max_sessions,
+            "minted": self.minted,
+            "rejected": self.rejected,
+        }
+
+    async def aclose(self):
+        if self._api is not None:
+            await self._api.aclose()
+
+
+class SessionServer(threading.Thread):
+    """Small HTTP endpoint handing out sessions, run on its own event loop.
+
+    POST /session returns {"url", "token", "room", "identity"} as JSON, or 503
+    once MAX_SESSIONS are live. GET / redirects a browser to the meet client
+    with a fresh session when meet_url is set. GET /sessions returns the counts.
+    """
+
+    def __init__(
+        self,
+        manager: SessionManager,
+        client_url: str,
+        host: str = SESSION_HOST,
+        port: int = SESSION_PORT,
+        meet_url: str | None = None,
+    ):
+        super().__init__(name="session-server", daemon=True)
+        self.manager = manager
+        self.client_url = client_url
+        self.host = host
+        self.port = port
+        self.meet_url = meet_url
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._stopped: asyncio.Event | None = None
+        self._ready = threading.Event()
+        self._serving = False
+        self._error: OSError | None = None
+
+    @property
+    def url(self) -> str:
+        host = "localhost" if self.host in ("0.0.0.0", "") else self.host
+        return f"http://{host}:{self.port}"
+
+    def run(self):
+        asyncio.run(self._serve())
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+
+        app = web.Application()
+        app.add_routes([
+            web.post("/session", self._create_session),
+            web.get("/sessions", self._list_sessions),
+            web.get("/", self._open_meet),
+        ])
+        runner = web.AppRunner(app)
+        await runner.setup()
+        try:
+            try:
+                await web.TCPSite(runner, self.host, self.port).start()
+            except OSError as e:
+                self._error = e
+                return
+            self._serving = True
+            self._ready.set()
+            await self._stopped.wait()
+        finally:
+            self._serving = False
+            self._ready.set()
+            await runner.cleanup()
+            await self.manager.aclose()
+
+    def start(self, timeout: float = 5.0):
+        """Start serving, raising SessionServerError if the endpoint isn't up within timeout."""
+        super().start()
+        self._ready.wait(timeout)
+        if not self._serving:
+            raise SessionServerError(f"session endpoint failed to start on {self.host}:{self.port}: {self._error or 'timed out'}")
+
+    def mint(self, timeout: float = 10.0) -> Session:
+        """Mint a session from another thread, raising SessionServerError if none is available."""
+        if not self._serving:
+            raise SessionServerError("session endpoint is not running")
+        future = asyncio.run_coroutine_threadsafe(self.manager.mint(), self._loop)
+        try:
+            session = future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise SessionServerError(f"minting a session took longer than {timeout:g} s") from None
+        if session is None:
+            raise SessionServerError(f"all {self.manager.max_sessions} sessions are in use")
+        return session
+
+    def stop(self):
+        if self._loop is not None and self._stopped is not None:
+            self._loop.call_soon_threadsafe(self._stopped.set)
+
+    async def _create_session(self, request: web.Request) -> web.Response:
+        session = await self.manager.mint()
+        if session is None:
+            return web.json_response({"error": "too many sessions", **self.manager.stats()}, status=503)
+        return web.json_response({
+            "url": self.client_url,
+            "token": session.token,
+            "room": session.room,
+            "identity": session.identity,
+        })
+
+    async def _list_sessions(self, request: web.Request) -> web.Response:
+        await self.manager.refresh()
+        return web.json_response(self.manager.stats())
+
+    async def _open_meet(self, request: web.Request) -> web.Response:
+        if not self.meet_url:
+            raise web.HTTPNotFound()
+        session = await self.manager.mint()
+        if session is None:
+            return web.Response(text="All sessions are in use, try again in a minute.", status=503)
+        raise web.HTTPFound(self.meet_url.format(token=quote(session.token)))
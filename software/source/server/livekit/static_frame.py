@@ -0,0 +1,110 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+from livekit import rtc
+
+
+# Publish rates for the agent's static video track
+ACTIVE_FPS = float(os.getenv('01_STATIC_ACTIVE_FPS', '30'))
+IDLE_FPS = float(os.getenv('01_STATIC_IDLE_FPS', '1'))
+# How long to stay at the active rate after the image changes
+ACTIVE_SECONDS = float(os.getenv('01_STATIC_ACTIVE_SECONDS', '2'))
+
+
+class StaticFramePublisher:
+    """Publishes an image that rarely changes to a video source.
+
+    The VideoFrame is built once per image and re-sent as is. The rate drops to
+    IDLE_FPS (a keep-alive for late subscribers) while the image is unchanged and
+    goes back to ACTIVE_FPS for ACTIVE_SECONDS whenever set_image() gets a new one.
+    """
+
+    def __init__(
+        self,
+        source: rtc.VideoSource,
+        image_np: np.ndarray,
+        active_fps: float = ACTIVE_FPS,
+        idle_fps: float = IDLE_FPS,
+        active_seconds: float = ACTIVE_SECONDS,
+    ):
+        self.source = source
+        self.active_fps = active_fps
+        self.idle_fps = idle_fps
+        self.active_seconds = active_seconds
+
+        self._image_np: np.ndarray | None = None
+        self._frame: rtc.VideoFrame | None = None
+        self._changed = asyncio.Event()
+        self._active_until = 0.0
+
+        # stats for report()
+        self._started_at: float | None = None
+        self._frames_sent = 0
+        self._frames_built = 0
+        self._build_cpu = 0.0
+        self._capture_cpu = 0.0
+
+        self.set_image(image_np)
+
+    def set_image(self, image_np: np.ndarray) -> bool:
+        """Replace the published image. Returns False (and keeps the idle rate) if it did not change."""
+        if self._image_np is not None and np.array_equal(self._image_np, image_np):
+            return False
+
+        start = time.thread_time()
+        height, width = image_np.shape[:2]
+        image_np = np.ascontiguousarray(image_np, dtype=np.uint8)
+        self._frame = rtc.VideoFrame(width, height, rtc.VideoBufferType.RGBA, image_np.tobytes())
+        self._image_np = image_np.copy()
+        self._build_cpu += time.thread_time() - start
+        self._frames_built += 1
+
+        self._active_until = time.monotonic() + self.active_seconds
+        self._changed.set()
+        return True
+
+    async def run(self):
+        """Publish frames until cancelled."""
+        self._started_at = time.monotonic()
+        while True:
+            start = time.thread_time()
+            self.source.capture_frame(self._frame)
+            self._capture_cpu += time.thread_time() - start
+            self._frames_sent += 1
+
+            if time.monotonic() < self._active_until:
+                await asyncio.sleep(1 / self.active_fps)
+                continue
+
+            # idle: sleep until the keep-alive tick or until the image changes
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout=1 / self.idle_fps)
+            except asyncio.TimeoutError:
+                pass
+
+    def report(self) -> dict:
+        """Savings against re-building a frame for every tick at ACTIVE_FPS."""
+        elapsed = time.monotonic() - self._started_at if self._started_at else 0.0
+        frame_bytes = self._frame.width * self._frame.height * 4
+        baseline_frames = int(elapsed * self.active_fps)
+        frames_skipped = max(baseline_frames - self._frames_sent, 0)
+
+        capture_cost = self._capture_cpu / self._frames_sent if self._frames_sent else 0.0
+        build_cost = self._build_cpu / self._frames_built if self._frames_built else 0.0
+        baseline_cpu = baseline_frames * (capture_cost + build_cost)
+
+        bytes_not_copied = max(baseline_frames - self._frames_built, 0) * frame_bytes
+
+        return {
+            "elapsed_s": round(elapsed, 1),
+            "frames_sent": self._frames_sent,
+            "frames_skipped": frames_skipped,
+            "frames_built": self._frames_built,
+            "bytes_not_copied": bytes_not_copied,
+            "copy_mb_s_saved": round(bytes_not_copied / elapsed / 1e6, 1) if elapsed else 0.0,
+            "cpu_s": round(self._capture_cpu + self._build_cpu, 3),
+            "cpu_s_saved": round(max(baseline_cpu - self._capture_cpu - self._build_cpu, 0.0), 3),
+        }
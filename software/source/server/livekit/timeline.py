@@ -0,0 +1,124 @@
+import math
+import os
+
+import numpy as np
+from livekit.rtc import VideoFrame, VideoBufferType
+
+
+# Total bytes the downscaled frames may use, however long the session runs
+TIMELINE_MAX_BYTES = int(os.getenv('01_TIMELINE_MAX_BYTES', str(8 * 1024 * 1024)))
+# Frames are downscaled so their long edge is at most this many pixels
+TIMELINE_LONG_EDGE = int(os.getenv('01_TIMELINE_LONG_EDGE', '320'))
+# Number of keyframes tiled into the composite sent to the LLM
+TIMELINE_MOSAIC_FRAMES = int(os.getenv('01_TIMELINE_MOSAIC_FRAMES', '6'))
+# Mean absolute difference (0-255) of a 16x16 grayscale signature that counts as a scene change
+SCENE_CHANGE_THRESHOLD = float(os.getenv('01_TIMELINE_SCENE_THRESHOLD', '10'))
+
+SIGNATURE_SIZE = 16
+
+
+def rgba_view(frame: VideoFrame) -> np.ndarray:
+    """(height, width, 4) view on an RGBA frame's buffer, without copying it."""
+    return np.frombuffer(frame.data, dtype=np.uint8).reshape(frame.height, frame.width, 4)
+
+
+def signature(image: np.ndarray, size: int = SIGNATURE_SIZE) -> np.ndarray:
+    """Tiny grayscale thumbnail used to compare scenes."""
+    height, width = image.shape[:2]
+    ys = np.linspace(0, height - 1, size).astype(int)
+    xs = np.linspace(0, width - 1, size).astype(int)
+    return image[np.ix_(ys, xs)][..., :3].mean(axis=2, dtype=np.float32)
+
+
+class VideoTimeline:
+    """Fixed-size ring buffer of downscaled keyframes with timestamps.
+
+    A frame is only kept when its signature differs enough from the last
+    keyframe, so a static scene doesn't push history out of the buffer. Storage
+    is allocated once from the byte budget and memory stays flat no matter how
+    long the session runs.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = TIMELINE_MAX_BYTES,
+        long_edge: int = TIMELINE_LONG_EDGE,
+        mosaic_frames: int = TIMELINE_MOSAIC_FRAMES,
+        scene_threshold: float = SCENE_CHANGE_THRESHOLD,
+    ):
+        self.max_bytes = max_bytes
+        self.long_edge = long_edge
+        self.mosaic_frames = mosaic_frames
+        self.scene_threshold = scene_threshold
+
+        self._frames: np.ndarray | None = None  # (capacity, h, w, 3)
+        self._timestamps: np.ndarray | None = None
+        self._source_size: tuple[int, int] | None = None
+        self._step = 1
+        self._next = 0
+        self._count = 0
+        self._last_signature: np.ndarray | None = None
+
+    @property
+    def capacity(self) -> int:
+        return 0 if self._frames is None else len(self._frames)
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._frames is None else self._frames.nbytes + self._timestamps.nbytes
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _allocate(self, width: int, height: int):
+        step = max(math.ceil(max(width, height) / self.long_edge), 1)
+        thumb_height, thumb_width = math.ceil(height / step), math.ceil(width / step)
+        capacity = max(self.max_bytes // (thumb_height * thumb_width * 3 + 8), 1)
+
+        self._frames = np.zeros((capacity, thumb_height, thumb_width, 3), dtype=np.uint8)
+        self._timestamps = np.zeros(capacity, dtype=np.int64)
+        self._source_size = (width, height)
+        self._step = step
+        self._next = 0
+        self._count = 0
+        self._last_signature = None
+
+    def add(self, frame: VideoFrame, timestamp_us: int) -> bool:
+        """Keep a downscaled copy of an RGBA frame if the scene changed. Returns True if it was kept."""
+        if self._source_size != (frame.width, frame.height):
+            self._allocate(frame.width, frame.height)
+
+        # strided view, nothing is copied until the frame is known to be a keyframe
+        thumb = rgba_view(frame)[::self._step, ::self._step, :3]
+        frame_signature = signature(thumb)
+        if self._last_signature is not None and np.abs(frame_signature - self._last_signature).mean() <= self.scene_threshold:
+            return False
+        self._last_signature = frame_signature
+
+        self._frames[self._next] = thumb
+        self._timestamps[self._next] = timestamp_us
+        self._next = (self._next + 1) % self.capacity
+        self._count = min(self._count + 1, self.capacity)
+        return True
+
+    def latest_slots(self, limit: int) -> list[int]:
+        """Slots of the newest keyframes, oldest first."""
+        count = min(limit, self._count)
+        return [(self._next - i) % self.capacity for i in range(count, 0, -1)]
+
+    def mosaic(self) -> VideoFrame | None:
+        """Tile the last mosaic_frames keyframes into one RGBA frame (oldest top-left)."""
+        slots = self.latest_slots(self.mosaic_frames)
+        if not slots:
+            return None
+
+        _, height, width, _ = self._frames.shape
+        cols = math.ceil(math.sqrt(len(slots)))
+        rows = math.ceil(len(slots) / cols)
+        canvas = np.zeros((rows * height, cols * width, 4), dtype=np.uint8)
+        canvas[..., 3] = 255
+        for i, slot in enumerate(slots):
+            row, col = divmod(i, cols)
+            canvas[row * height:(row + 1) * height, col * width:(col + 1) * width, :3] = self._frames[slot]
+
+        return VideoFrame(canvas.shape[1], canvas.shape[0], VideoBufferType.RGBA, canvas.tobytes())
@@ -0,0 +1,175 @@
+import math
+import os
+import time
+
+from source.server.livekit import logger
+from source.server.livekit.logger import get_logger, log_message
+
+
+# One JSON line per turn is appended here when DEBUG is on
+TRACE_FILE_PATH = os.getenv('01_TRACE_FILE', 'latency_trace.jsonl')
+
+# Stages in the order they normally happen during a turn
+STAGES = (
+    "vad_end",
+    "complete_received",
+    "stt_final",
+    "before_llm_cb",
+    "vision_frame_start",
+    "vision_frame_end",
+    "llm_request",
+    "llm_first_token",
+    "tts_first_byte",
+    "playout_start",
+)
+
+PERCENTILES = (50, 90, 99)
+# Request image sizes, in bytes, that time to first token is broken down by
+IMAGE_SIZE_BUCKETS = ((0, 1), (1, 100 * 1024), (100 * 1024, 250 * 1024), (250 * 1024, 500 * 1024), (500 * 1024, float("inf")))
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile of an unsorted list."""
+    ordered = sorted(values)
+    index = math.ceil(q / 100 * len(ordered)) - 1
+    return ordered[min(max(index, 0), len(ordered) - 1)]
+
+
+class TurnTracer:
+    """Monotonic timestamps for each stage of a voice turn.
+
+    A turn starts at VAD end of speech (or at {COMPLETE} in push-to-talk) and is
+    written out once the agent stops speaking. Each stage keeps only its first
+    timestamp so repeated callbacks within a turn don't move it.
+    """
+
+    def __init__(self, path: str = TRACE_FILE_PATH, session: str = ""):
+        self._write = get_logger(path, log_format='json')
+        # tells apart the turns of concurrent sessions sharing the trace file
+        self.session = session
+        self.turn_index = 0
+        self.turn: dict[str, float] | None = None
+        self.fields: dict = {}
+        self.turns: list[dict[str, float]] = []
+        self.turn_fields: list[dict] = []
+
+    @property
+    def enabled(self) -> bool:
+        return logger.DEBUG
+
+    def start_turn(self, stage: str):
+        """Begin a new turn with its first stage, writing out any turn still open."""
+        if not self.enabled:
+            return
+        self.end_turn()
+        self.turn_index += 1
+        self.turn = {}
+        self.fields = {}
+        self.mark(stage)
+
+    def mark(self, stage: str, at: float | None = None, **fields):
+        """Record when a stage happened (now, or at a time.monotonic() value)."""
+        if self.turn is None:
+            return
+        self.turn.setdefault(stage, time.monotonic() if at is None else at)
+        self.fields.update(fields)
+
+    def annotate(self, **fields):
+        """Attach extra values (e.g. metrics reported by the agent) to the current turn."""
+        if self.turn is not None:
+            self.fields.update(fields)
+
+    def mark_wall(self, stage: str, wall_time: float, **fields):
+        """Record a stage reported as a time.time() value, e.g. from agent metrics."""
+        self.mark(stage, time.monotonic() - (time.time() - wall_time), **fields)
+
+    def has(self, stage: str) -> bool:
+        return self.turn is not None and stage in self.turn
+
+    def end_turn(self):
+        if not self.turn:
+            self.turn = None
+            return
+
+        start = min(self.turn.values())
+        offsets = {stage: round((ts - start) * 1000, 1) for stage, ts in sorted(self.turn.items(), key=lambda i: i[1])}
+        self.turns.append(offsets)
+        self.turn_fields.append(self.fields)
+        session = {"session": self.session} if self.session else {}
+        self._write("turn", turn=self.turn_index, offsets_ms=offsets, **session, **self.fields)
+        self.turn = None
+
+    def summary(self) -> str:
+        """Percentiles of each stage's offset from the start of its turn, in ms."""
+        self.end_turn()
+        if not self.turns:
+            return "no turns traced"
+
+        header = f"{'stage':<20}" + "".join(f"{f'p{q}':>10}" for q in PERCENTILES) + f"{'n':>6}"
+        lines = [f"latency over {len(self.turns)} turns (ms from turn start)", header]
+        known = [s for s in STAGES if any(s in t for t in self.turns)]
+        extra = sorted({s for t in self.turns for s in t} - set(STAGES))
+        for stage in known + extra:
+            values = [t[stage] for t in self.turns if stage in t]
+            lines.append(
+                f"{stage:<20}" + "".join(f"{percentile(values, q):>10.1f}" for q in PERCENTILES) + f"{len(values):>6}"
+            )
+        lines.extend(self._ttft_by_image_size())
+        lines.extend(self._first_turn())
+        return "\n".join(lines)
+
+    def _first_turn(self) -> list[str]:
+        """LLM latency of the first turn, which pays for any cold start, against the later turns."""
+        first, later = self.turns[0], self.turns[1:]
+        first_fields, later_fields = self.turn_fields[0], self.turn_fields[1:]
+
+        rows = []
+        if "llm_first_token" in first:
+            values = [t["llm_first_token"] for t in later if "llm_first_token" in t]
+            rows.append(("llm_first_token", first["llm_first_token"], values))
+        if "llm_ttft_ms" in first_fields:
+            values = [f["llm_ttft_ms"] for f in later_fields if "llm_ttft_ms" in f]
+            rows.append(("llm_ttft_ms", first_fields["llm_ttft_ms"], values))
+        if not rows:
+            return []
+
+        lines = ["first turn vs later turns (ms)", f"{'':<20}{'first':>10}{'p50':>10}{'n':>6}"]
+        for name, value, values in rows:
+            p50 = f"{percentile(values, 50):>10.1f}" if values else f"{'-':>10}"
+            lines.append(f"{name:<20}{value:>10.1f}{p50}{len(values):>6}")
+        if "interpreter_warm_up_ms" in first_fields:
+            warm_up_ms = first_fields["interpreter_warm_up_ms"]
+            lines.append(
+                f"interpreter warmed up in {warm_up_ms:.0f} ms before the first turn" if warm_up_ms is not None
+                else "interpreter was not warmed up before the first turn"
+            )
+        return lines
+
+    def _ttft_by_image_size(self) -> list[str]:
+        """Median LLM time to first token grouped by how many image bytes the request carried."""
+        samples = [
+            (fields.get("request_image_bytes", 0), fields["llm_ttft_ms"])
+            for fields in self.turn_fields if "llm_ttft_ms" in fields
+        ]
+        if not any(size for size, _ in samples):
+            return []
+
+        lines = ["llm ttft p50 by image bytes in request"]
+        for low, high in IMAGE_SIZE_BUCKETS:
+            values = [ttft for size, ttft in samples if low <= size < high]
+            if values:
+                if high == 1:
+                    label = "no images"
+                elif high == float("inf"):
+                    label = f">= {low // 1024} KB"
+                else:
+                    label = f"{low // 1024}-{high // 1024} KB"
+                lines.append(f"{label:<20}{percentile(values, 50):>10.1f}{len(values):>6}")
+        return lines
+
+    def print_summary(self):
+        if not self.enabled:
+            return
+        summary = self.summary()
+        print(summary)
+        log_message("latency summary\n%s", summary)
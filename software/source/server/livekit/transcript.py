@@ -0,0 +1,59 @@
+def extends_text(text: str, prefix: str) -> bool:
+    """Whether text is prefix followed by more words (or nothing)."""
+    return text.startswith(prefix) and (len(text) == len(prefix) or text[len(prefix)].isspace())
+
+
+class TranscriptAccumulator:
+    """Push-to-talk transcript split into committed and pending text.
+
+    update() is called with the agent's user transcript on every
+    before_llm_cb. Once the callback returns False the agent drops the text
+    it handed over, so each call normally carries only the words spoken
+    since the previous one, without a separating space. Segments are joined
+    with a space into the pending text; earlier text is never rescanned
+    beyond a single startswith() against the pending text.
+
+    A segment that repeats the whole pending text and goes on (the agent
+    handed its text over again before trimming it) replaces the pending text
+    instead of being appended to it. Segments are only ever reconciled with
+    the pending text: committed text has been sent to the LLM, and the agent
+    never hands it over again.
+    """
+
+    def __init__(self):
+        self._committed: list[str] = []
+        self.committed_offset = 0
+        self.pending = ""
+        self.segments = 0
+        self.repeats = 0
+
+    @property
+    def committed(self) -> str:
+        return " ".join(self._committed)
+
+    def update(self, segment: str) -> str:
+        """Add the text the agent handed over and return the pending text."""
+        text = segment.strip()
+        if not text:
+            return self.pending
+
+        self.segments += 1
+        if self.pending and extends_text(text, self.pending):
+            # handed over again, along with what was said since
+            self.repeats += 1
+            self.pending = text
+        elif self.pending:
+            self.pending = f"{self.pending} {text}"
+        else:
+            self.pending = text
+        return self.pending
+
+    def commit(self) -> str:
+        """Mark the pending text as committed and return it."""
+        text = self.pending
+        if text:
+            self._committed.append(text)
+            # counting the space that joins it to the text committed before
+            self.committed_offset += len(text) + (1 if self.committed_offset else 0)
+            self.pending = ""
+        return text
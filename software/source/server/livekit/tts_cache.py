@@ -0,0 +1,340 @@
+import asyncio
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional
+
+from livekit import rtc
+from livekit.agents import tts, utils
+from livekit.agents.types import APIConnectOptions
+from livekit.agents.utils.aio.channel import ChanClosed, ChanEmpty
+
+from source.server.livekit.logger import log_message
+
+
+TTS_CACHE_DIR = os.getenv('01_TTS_CACHE_DIR', os.path.join(os.path.expanduser("~"), ".cache", "01", "tts"))
+# Total size of the audio kept in memory and on disk, least recently used goes first
+TTS_CACHE_MEMORY_BYTES = int(os.getenv('01_TTS_CACHE_MEMORY_BYTES', str(32 * 1024 * 1024)))
+TTS_CACHE_DISK_BYTES = int(os.getenv('01_TTS_CACHE_DISK_BYTES', str(256 * 1024 * 1024)))
+# Longer texts are synthesized without being cached
+TTS_CACHE_MAX_CHARS = int(os.getenv('01_TTS_CACHE_MAX_CHARS', '500'))
+
+# Cached audio is replayed in frames of this length
+FRAME_MS = 50
+# Cached streams can't fail part way, so they are never retried
+NO_RETRY = APIConnectOptions(max_retry=0)
+
+
+class TTSCache:
+    """Synthesized PCM keyed by a hash, in an in-memory LRU backed by files on disk.
+
+    Both tiers are bounded by total bytes. The disk tier uses file modification
+    times as its LRU order, so it survives restarts and is shared by every
+    worker process.
+    """
+
+    def __init__(
+        self,
+        directory: str = TTS_CACHE_DIR,
+        memory_bytes: int = TTS_CACHE_MEMORY_BYTES,
+        disk_bytes: int = TTS_CACHE_DISK_BYTES,
+    ):
+        self.directory = directory
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk_size: int | None = None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.pcm")
+
+    def _remember(self, key: str, pcm: bytes):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            return
+        self._memory[key] = pcm
+        self._memory_size += len(pcm)
+        while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _read(self, key: str) -> bytes | None:
+        try:
+            with open(self._path(key), "rb") as f:
+                pcm = f.read()
+            os.utime(self._path(key))
+            return pcm
+        except OSError:
+            return None
+
+    def _write(self, key: str, pcm: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(pcm)
+        os.replace(tmp_path, self._path(key))
+
+        if self._disk_size is not None:
+            self._disk_size += len(pcm)
+        if self._disk_size is not None and self._disk_size <= self.disk_bytes:
+            return
+
+        # rescan rather than trust the running total, other worker processes write here too
+        files = self._files()
+        self._disk_size = sum(size for _, _, size in files)
+        for _, path, size in files:
+            if self._disk_size <= self.disk_bytes:
+                break
+            if path == self._path(key):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._disk_size -= size
+            self.evictions += 1
+
+    def _files(self) -> list[tuple[float, str, int]]:
+        """Cached files, least recently used first."""
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".pcm"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.path, stat.st_size))
+        return sorted(files)
+
+    async def get(self, key: str) -> bytes | None:
+        pcm = self._memory.get(key)
+        if pcm is not None:
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return pcm
+
+        pcm = await asyncio.to_thread(self._read, key)
+        if pcm is None:
+            self.misses += 1
+            return None
+        self._remember(key, pcm)
+        self.hits += 1
+        self.disk_hits += 1
+        return pcm
+
+    async def put(self, key: str, pcm: bytes):
+        self._remember(key, pcm)
+        try:
+            await asyncio.to_thread(self._write, key, pcm)
+        except OSError as e:
+            log_message("Failed to write TTS cache entry %s: %s", key, e)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 2) if lookups else None,
+            "memory_bytes": self._memory_size,
+            "evictions": self.evictions,
+        }
+
+
+_tts_cache: TTSCache | None = None
+
+
+def get_tts_cache() -> TTSCache:
+    """The worker process's shared TTSCache."""
+    global _tts_cache
+    if _tts_cache is None:
+        _tts_cache = TTSCache()
+    return _tts_cache
+
+
+def provider_identity(provider: tts.TTS) -> list:
+    """Label, voice and model of a TTS, or of each TTS behind an adapter."""
+    instances = getattr(provider, "_tts_instances", None)
+    if instances:
+        return [provider_identity(instance) for instance in instances]
+    inner = getattr(provider, "_tts", None)
+    if isinstance(inner, tts.TTS):
+        return provider_identity(inner)
+    opts = getattr(provider, "_opts", None)
+    return [
+        provider.label,
+        str(getattr(opts, "voice", "")),
+        str(getattr(opts, "model", getattr(opts, "model_id", ""))),
+    ]
+
+
+class CachedTTS(tts.TTS):
+    """Wraps a TTS so repeated texts are played from the cache.
+
+    synthesize() calls are looked up by text. That covers everything spoken
+    through a non-streaming provider, because the agent splits speech into
+    sentences for it. stream() looks up segments whose whole text arrives at
+    once, such as assistant.say(str). Text streamed token by token from the
+    LLM goes straight through to the provider.
+    """
+
+    def __init__(self, tts: tts.TTS, cache: TTSCache | None = None):
+        super().__init__(
+            capabilities=tts.capabilities,
+            sample_rate=tts.sample_rate,
+            num_channels=tts.num_channels,
+        )
+        self._tts = tts
+        self._label = tts.label
+        self.cache = cache or get_tts_cache()
+
+    def cache_key(self, text: str) -> str | None:
+        if len(text) > TTS_CACHE_MAX_CHARS:
+            return None
+        key = [
+            provider_identity(self._tts),
+            self.sample_rate,
+            self.num_channels,
+            text.strip(),
+        ]
+        return hashlib.sha256(json.dumps(key).encode()).hexdigest()
+
+    def frames(self, pcm: bytes) -> list[rtc.AudioFrame]:
+        """Split cached 16-bit PCM into playable frames."""
+        samples_per_frame = self.sample_rate * FRAME_MS // 1000
+        frame_bytes = samples_per_frame * self.num_channels * 2
+        return [
+            rtc.AudioFrame(
+                data=pcm[offset:offset + frame_bytes],
+                sample_rate=self.sample_rate,
+                num_channels=self.num_channels,
+                samples_per_channel=len(pcm[offset:offset + frame_bytes]) // (2 * self.num_channels),
+            )
+            for offset in range(0, len(pcm), frame_bytes)
+        ]
+
+    def synthesize(self, text: str, *, conn_options: Optional[APIConnectOptions] = None) -> "CachedChunkedStream":
+        return CachedChunkedStream(tts=self, input_text=text, inner_conn_options=conn_options)
+
+    def stream(self, *, conn_options: Optional[APIConnectOptions] = None) -> "CachedSynthesizeStream":
+        if not self._tts.capabilities.streaming:
+            return super().stream(conn_options=conn_options)
+        return CachedSynthesizeStream(tts=self, inner_conn_options=conn_options)
+
+    def prewarm(self) -> None:
+        prewarm = getattr(self._tts, "prewarm", None)
+        if prewarm:
+            prewarm()
+
+    async def aclose(self) -> None:
+        await self._tts.aclose()
+
+
+class CachedChunkedStream(tts.ChunkedStream):
+    def __init__(self, *, tts: CachedTTS, input_text: str, inner_conn_options: Optional[APIConnectOptions]):
+        super().__init__(tts=tts, input_text=input_text, conn_options=NO_RETRY)
+        self._cached_tts = tts
+        self._inner_conn_options = inner_conn_options
+
+    async def _run(self) -> None:
+        cached_tts = self._cached_tts
+        key = cached_tts.cache_key(self._input_text)
+        request_id = utils.shortuuid()
+
+        pcm = await cached_tts.cache.get(key) if key else None
+        if pcm is not None:
+            log_message("TTS cache hit: %s", self._input_text)
+            for frame in cached_tts.frames(pcm):
+                self._event_ch.send_nowait(tts.SynthesizedAudio(frame=frame, request_id=request_id))
+            return
+
+        chunks = []
+        async with cached_tts._tts.synthesize(self._input_text, conn_options=self._inner_conn_options) as stream:
+            async for audio in stream:
+                chunks.append(bytes(audio.frame.data))
+                self._event_ch.send_nowait(audio)
+        if key:
+            await cached_tts.cache.put(key, b"".join(chunks))
+
+
+class CachedSynthesizeStream(tts.SynthesizeStream):
+    def __init__(self, *, tts: CachedTTS, inner_conn_options: Optional[APIConnectOptions]):
+        super().__init__(tts=tts, conn_options=NO_RETRY)
+        self._cached_tts = tts
+        self._inner_conn_options = inner_conn_options
+
+    async def _run(self) -> None:
+        async for data in self._input_ch:
+            if isinstance(data, self._FlushSentinel):
+                continue
+            self._mark_started()
+
+            # the whole segment was pushed at once if its flush is already queued
+            try:
+                following = self._input_ch.recv_nowait()
+            except (ChanEmpty, ChanClosed):
+                following = None
+
+            if isinstance(following, self._FlushSentinel):
+                await self._synthesize_segment(data)
+            else:
+                await self._pass_through(data, following)
+                return
+
+    async def _synthesize_segment(self, text: str):
+        cached_tts = self._cached_tts
+        key = cached_tts.cache_key(text)
+        segment_id = utils.shortuuid()
+        emitter = tts.SynthesizedAudioEmitter(event_ch=self._event_ch, request_id=utils.shortuuid(), segment_id=segment_id)
+
+        pcm = await cached_tts.cache.get(key) if key else None
+        if pcm is not None:
+            log_message("TTS cache hit: %s", text)
+            for frame in cached_tts.frames(pcm):
+                emitter.push(frame)
+            emitter.flush()
+            return
+
+        chunks = []
+        stream = cached_tts._tts.stream(conn_options=self._inner_conn_options)
+        try:
+            stream.push_text(text)
+            stream.end_input()
+            async for audio in stream:
+                chunks.append(bytes(audio.frame.data))
+                emitter.push(audio.frame)
+            emitter.flush()
+        finally:
+            await stream.aclose()
+        if key:
+            await cached_tts.cache.put(key, b"".join(chunks))
+
+    async def _pass_through(self, first: str, following: str | None):
+        stream = self._cached_tts._tts.stream(conn_options=self._inner_conn_options)
+
+        async def _forward_input():
+            stream.push_text(first)
+            if following is not None:
+                stream.push_text(following)
+            async for data in self._input_ch:
+                if isinstance(data, self._FlushSentinel):
+                    stream.flush()
+                else:
+                    stream.push_text(data)
+            stream.end_input()
+
+        async def _forward_audio():
+            async for audio in stream:
+                self._event_ch.send_nowait(audio)
+
+        tasks = [asyncio.create_task(_forward_input()), asyncio.create_task(_forward_audio())]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            await utils.aio.gracefully_cancel(*tasks)
+            await stream.aclose()
@@ -1,41 +1,42 @@
 from livekit.rtc import VideoStream, VideoFrame, VideoBufferType
 from livekit.agents import JobContext
-from datetime import datetime
-import os
 import asyncio
+import os
 from typing import Callable, Coroutine, Any
 
+from source.server.livekit.logger import get_logger
+from source.server.livekit.timeline import VideoTimeline
+
 
 # Interval settings
 INTERVAL = 30  # seconds
+# Only every frame this many seconds apart is processed; the latest-frame slot still sees all of them
+FRAME_INTERVAL = float(os.getenv('01_VIDEO_FRAME_INTERVAL', '0.5'))  # seconds
 
-# Define the path to the log file
-LOG_FILE_PATH = 'video_processor.txt'
-DEBUG = os.getenv('DEBUG', 'false').lower() == 'true'
-
-def log_message(message: str):
-    """Append a message to the log file with a timestamp."""
-    if not DEBUG:
-        return
-    
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    with open(LOG_FILE_PATH, 'a') as log_file:
-        log_file.write(f"{timestamp} - {message}\n")
+log_message = get_logger('video_processor.txt')
 
 class RemoteVideoProcessor:
-    def __init__(self, video_stream: VideoStream, job_ctx: JobContext):
+    def __init__(self, video_stream: VideoStream, job_ctx: JobContext, frame_interval: float = FRAME_INTERVAL):
         log_message("Initializing RemoteVideoProcessor")
         self.video_stream = video_stream
         self.job_ctx = job_ctx
-        self.current_frame = None
-        self.lock = asyncio.Lock()
+
+        # Latest-frame slot. process_frames is its only writer and swapping the
+        # reference is atomic on the event loop, so readers never wait for a lock.
+        self.current_frame: VideoFrame | None = None
+        # Downscaled history of processed frames, capped by a byte budget
+        self.timeline = VideoTimeline()
         
         self.interval = INTERVAL
+        self.frame_interval = frame_interval
         self.video_context = False
         self.last_capture_time = 0
+        self.last_processed_time = None
         
         # Add callback for safety checks
         self.on_instruction_check: Callable[[VideoFrame], Coroutine[Any, Any, None]] | None = None
+        # At most one instruction check runs at a time, outside the ingest loop
+        self._instruction_check_task: asyncio.Task | None = None
 
     async def process_frames(self):
         """Process incoming video frames."""
@@ -43,23 +44,48 @@ class RemoteVideoProcessor:
             try:
                 video_frame = frame_event.frame
                 timestamp = frame_event.timestamp_us
+
+                self.current_frame = video_frame
+
+                # decimate: skip everything but the latest-frame update until frame_interval has passed
+                if self.last_processed_time is not None and timestamp - self.last_processed_time < self.frame_interval * 1000000:
+                    continue
+                self.last_processed_time = timestamp
                 
-                log_message(f"Processing frame at timestamp {timestamp/1000000:.3f}s")
-                log_message(f"Frame details: size={video_frame.width}x{video_frame.height}, type={video_frame.type}")
-
-                async with self.lock:
-                    self.current_frame = video_frame
-                    
-                    if self.video_context and self._check_interrupt(timestamp):
-                        self.last_capture_time = timestamp
-                        # Trigger instruction check callback if registered
-                        if self.on_instruction_check:
-                            await self.on_instruction_check(video_frame)
+                log_message("Processing frame at timestamp %.3fs", timestamp/1000000)
+                log_message("Frame details: size=%sx%s, type=%s", video_frame.width, video_frame.height, video_frame.type)
+
+                if video_frame.type == VideoBufferType.RGBA and self.timeline.add(video_frame, timestamp):
+                    log_message("New timeline keyframe at %.3fs", timestamp/1000000)
+
+                if self.video_context and self._check_interrupt(timestamp) and self.on_instruction_check:
+                    if self._instruction_check_task and not self._instruction_check_task.done():
+                        log_message("Instruction check still in flight, skipping frame")
+                        continue
+
+                    self.last_capture_time = timestamp
+                    # Trigger instruction check callback in the background
+                    self._instruction_check_task = asyncio.create_task(self._run_instruction_check(video_frame))
 
             except Exception as e:
-                log_message(f"Error processing frame: {str(e)}")
+                log_message("Error processing frame: %s", e)
                 import traceback
-                log_message(f"Traceback: {traceback.format_exc()}")
+                log_message("Traceback: %s", traceback.format_exc())
+
+
+    async def _run_instruction_check(self, video_frame: VideoFrame):
+        try:
+            await self.on_instruction_check(video_frame)
+        except Exception as e:
+            import traceback
+            log_message("Error in instruction check: %s", e)
+            log_message("Traceback: %s", traceback.format_exc())
+
+
+    async def aclose(self):
+        """Cancel the in-flight instruction check, if any."""
+        if self._instruction_check_task and not self._instruction_check_task.done():
+            self._instruction_check_task.cancel()
 
 
     def register_safety_check_callback(self, callback: Callable[[VideoFrame], Coroutine[Any, Any, None]]):
@@ -71,15 +97,24 @@ class RemoteVideoProcessor:
     async def get_current_frame(self) -> VideoFrame | None:
         """Get the most recent video frame."""
         log_message("Getting current frame")
-        async with self.lock:
-            if self.current_frame is None:
-                log_message("No current frame available")
-            return self.current_frame
+        if self.current_frame is None:
+            log_message("No current frame available")
+        return self.current_frame
         
     
+    async def get_timeline_frame(self) -> VideoFrame | None:
+        """Get a mosaic of the most recent distinct keyframes, oldest top-left."""
+        log_message("Getting timeline frame")
+        frame = self.timeline.mosaic()
+        if frame is None:
+            log_message("No timeline frames yet, using current frame")
+            return self.current_frame
+        return frame
+        
+
     def set_video_context(self, context: bool):
         """Set the video context."""
-        log_message(f"Setting video context to: {context}")
+        log_message("Setting video context to: %s", context)
         self.video_context = context
 
 
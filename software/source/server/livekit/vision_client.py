@@ -0,0 +1,117 @@
+import asyncio
+import os
+
+import httpx
+from openai import AsyncOpenAI
+
+from source.server.livekit.load import get_in_flight
+from source.server.livekit.logger import log_message
+
+
+# OpenAI-compatible endpoint for vision checks, e.g. a local stand-in. Defaults to api.openai.com
+VISION_BASE_URL = os.getenv('01_VISION_BASE_URL') or None
+# Falls back to OPENAI_API_KEY
+VISION_API_KEY = os.getenv('01_VISION_API_KEY') or None
+VISION_MODEL = os.getenv('01_VISION_MODEL', 'gpt-4o-mini')
+# Deadline for a whole vision request, in seconds
+VISION_TIMEOUT = float(os.getenv('01_VISION_TIMEOUT', '15'))
+# Vision requests allowed in flight at once per worker process
+VISION_MAX_CONCURRENCY = int(os.getenv('01_VISION_MAX_CONCURRENCY', '2'))
+
+
+class VisionClient:
+    """One pooled async client per worker process for vision checks.
+
+    Keeps keep-alive connections to the endpoint, applies a per-request
+    deadline, caps concurrent requests with a semaphore and tracks in-flight
+    requests per participant so they can be cancelled when that participant leaves.
+    """
+
+    def __init__(
+        self,
+        base_url: str | None = VISION_BASE_URL,
+        model: str = VISION_MODEL,
+        timeout: float = VISION_TIMEOUT,
+        max_concurrency: int = VISION_MAX_CONCURRENCY,
+    ):
+        self.base_url = base_url
+        self.model = model
+        self.timeout = timeout
+        self.max_concurrency = max_concurrency
+
+        self._client: AsyncOpenAI | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self._in_flight: dict[str, set[asyncio.Task]] = {}
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        if self._client is None:
+            self._client = AsyncOpenAI(
+                api_key=VISION_API_KEY,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    timeout=httpx.Timeout(self.timeout, connect=5.0),
+                    limits=httpx.Limits(
+                        max_connections=self.max_concurrency,
+                        max_keepalive_connections=self.max_concurrency,
+                        keepalive_expiry=120,
+                    ),
+                ),
+            )
+        return self._client
+
+    @property
+    def in_flight(self) -> int:
+        return sum(len(tasks) for tasks in self._in_flight.values())
+
+    async def complete(self, messages: list[dict], max_tokens: int = 300, owner: str = "") -> str:
+        """Run a chat completion and return the message content.
+
+        Raises asyncio.TimeoutError if the request misses its deadline (waiting
+        for a free slot included) and CancelledError if cancel(owner) is called.
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def _create():
+            async with self._semaphore:
+                return await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                )
+
+        task = asyncio.current_task()
+        self._in_flight.setdefault(owner, set()).add(task)
+        try:
+            with get_in_flight().running("vision"):
+                response = await asyncio.wait_for(_create(), self.timeout)
+            log_message("Raw vision response: %s", response)
+            return response.choices[0].message.content
+        finally:
+            self._in_flight.get(owner, set()).discard(task)
+
+    def cancel(self, owner: str):
+        """Cancel the in-flight requests made on behalf of owner."""
+        tasks = self._in_flight.pop(owner, set())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            log_message("Cancelled %s vision requests for %s", len(tasks), owner)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+_vision_client: VisionClient | None = None
+
+
+def get_vision_client() -> VisionClient:
+    """The worker process's shared VisionClient."""
+    global _vision_client
+    if _vision_client is None:
+        _vision_client = VisionClient()
+    return _vision_client
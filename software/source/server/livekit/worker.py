@@ -2,32 +2,85 @@ import asyncio
 import numpy as np
 import sys
 import os
+import time
 from datetime import datetime
 from typing import Literal, Awaitable
 
-from livekit.agents import JobContext, WorkerOptions, cli, transcription
+from livekit.agents import JobContext, JobProcess, WorkerOptions, cli, transcription, metrics
 from livekit.agents.transcription import STTSegmentsForwarder
 from livekit.agents.llm import ChatContext
 from livekit import rtc
 from livekit.agents.pipeline import VoicePipelineAgent
-from livekit.plugins import deepgram, openai, silero, elevenlabs, cartesia
+from livekit.plugins import silero
 from livekit.agents.llm.chat_context import ChatContext, ChatImage, ChatMessage
 from livekit.agents.llm import LLMStream
-from livekit.agents.stt import SpeechStream
+from typing import AsyncIterable
+from livekit.agents.stt import SpeechStream, SpeechEventType, StreamAdapter
 
 from source.server.livekit.video_processor import RemoteVideoProcessor
-from source.server.livekit.anticipation import handle_instruction_check
+from source.server.livekit.anticipation import handle_instruction_check, SceneGate, SpeculativeLLM, SPECULATIVE_LLM
+from source.server.livekit.static_frame import StaticFramePublisher
+from source.server.livekit.frame_encoder import get_frame_encoder
+from source.server.livekit.image_budget import ImageBudget
+from source.server.livekit.context_compactor import ChatContextCompactor
+from source.server.livekit.vision_client import get_vision_client
+from source.server.livekit.interpreter_client import get_interpreter_client
+from source.server.livekit.interpreter_llm import INTERPRETER_BACKEND, InterpreterLLM
+from source.server.livekit.sessions import is_session_room
+from source.server.livekit.load import TrackedLLMStream, WorkerLoad, worker_load_threshold
 from source.server.livekit.logger import log_message
+from source.server.livekit.tracing import TurnTracer
+from source.server.livekit.transcript import TranscriptAccumulator
+from source.server.livekit.tts_cache import CachedTTS
+from source.server.livekit.providers import ProviderRegistry
 
 from dotenv import load_dotenv
 load_dotenv()
 
 
 
+# Cache synthesized audio for repeated phrases, see tts_cache.py
+TTS_CACHE_ENABLED = os.getenv('01_TTS_CACHE', 'true').lower() == 'true'
+
 START_MESSAGE = "Hi! You can hold the white circle below to speak to me. Try asking what I can do."
 
+# Worker processes kept initialized ahead of jobs, see prewarm()
+NUM_IDLE_PROCESSES = int(os.getenv('01_NUM_IDLE_PROCESSES', '1'))
+# Loading an in-process interpreter takes longer than the agents' default of 10 s
+PREWARM_TIMEOUT = float(os.getenv('01_PREWARM_TIMEOUT', '60'))
+
+
+def prewarm(proc: JobProcess):
+    """Load the VAD model, the providers and any in-process interpreter once per worker process, before it gets a job"""
+    start = time.perf_counter()
+    proc.userdata["vad"] = silero.VAD.load()
+    proc.userdata["providers"] = ProviderRegistry(vad=proc.userdata["vad"])
+    # thread pool for frame encoding
+    get_frame_encoder()
+    if INTERPRETER_BACKEND == "in-process":
+        proc.userdata["interpreter_llm"] = InterpreterLLM()
+    else:
+        get_interpreter_client()
+    proc.userdata["prewarm_s"] = time.perf_counter() - start
+    proc.userdata["prewarmed_at"] = time.perf_counter()
+    log_message("Prewarmed worker process in %.0f ms", proc.userdata["prewarm_s"] * 1000)
+
+
 # This function is the entrypoint for the agent.
 async def entrypoint(ctx: JobContext):
+    job_start = time.perf_counter()
+
+    interpreter_client = None
+    if INTERPRETER_BACKEND != "in-process":
+        # wakes the interpreter server while the room and the pipeline are set up
+        interpreter_client = get_interpreter_client()
+        interpreter_client.warm_up()
+
+        async def _close_interpreter_client():
+            await interpreter_client.aclose()
+
+        ctx.add_shutdown_callback(_close_interpreter_client)
+
     # Create an initial chat context with a system prompt
     initial_chat_ctx = ChatContext().append(
         role="system",
@@ -45,6 +98,22 @@ async def entrypoint(ctx: JobContext):
     # Initialize RemoteVideoProcessor
     remote_video_processor = None
 
+    # Shared by every video track of the session so its counters cover the whole job
+    scene_gate = SceneGate()
+    frame_encoder = get_frame_encoder()
+    image_budget = ImageBudget()
+    context_compactor = ChatContextCompactor()
+
+    async def _close_video_processor():
+        if remote_video_processor:
+            await remote_video_processor.aclose()
+        log_message("instruction check scene gate: %s", scene_gate.stats())
+        log_message("frame encoder: %s encodes, %s cache hits", frame_encoder.encodes, frame_encoder.cache_hits)
+        log_message("image budget: %s", image_budget.stats())
+        log_message("chat context: %s", context_compactor.stats())
+
+    ctx.add_shutdown_callback(_close_video_processor)
+
     ############################################################
     # publish agent image
     ############################################################
@@ -66,69 +135,140 @@ async def entrypoint(ctx: JobContext):
     options.source = rtc.TrackSource.SOURCE_CAMERA
     publication = await ctx.room.local_participant.publish_track(track, options)
 
-    # Function to continuously publish the static image
-    async def publish_static_image():
-        while True:
-            frame = rtc.VideoFrame(width, height, rtc.VideoBufferType.RGBA, image_np.tobytes())
-            source.capture_frame(frame)
-            await asyncio.sleep(1/30)  # Publish at 30 fps
+    # The frame is built once and re-sent, at a keep-alive rate while the image is unchanged
+    static_publisher = StaticFramePublisher(source, image_np)
+    static_publisher_task = asyncio.create_task(static_publisher.run())
+
+    async def _stop_static_publisher():
+        static_publisher_task.cancel()
+        log_message("static image publisher report: %s", static_publisher.report())
 
-    # Start publishing the static image
-    asyncio.create_task(publish_static_image())
+    ctx.add_shutdown_callback(_stop_static_publisher)
 
     ############################################################
     # initialize voice agent pipeline
     ############################################################
-    interpreter_server_host = os.getenv('INTERPRETER_SERVER_HOST', 'localhost')
-    interpreter_server_port = os.getenv('INTERPRETER_SERVER_PORT', '8000')
-    base_url = f"http://{interpreter_server_host}:{interpreter_server_port}/"
+    if INTERPRETER_BACKEND == "in-process":
+        # the profile's Interpreter running in this process, loaded by prewarm()
+        open_interpreter = ctx.proc.userdata.get("interpreter_llm") or InterpreterLLM()
+    else:
+        # INTERPRETER_SERVER_HOST/PORT over a keep-alive connection warmed up at job start
+        open_interpreter = interpreter_client.llm()
 
-    # For debugging
-    base_url = "http://127.0.0.1:8000/"
+    # loaded by prewarm() unless the process was started without it
+    vad = ctx.proc.userdata.get("vad") or silero.VAD.load()
 
-    open_interpreter = openai.LLM(
-        model="open-interpreter", base_url=base_url, api_key="x"
-    )
+    # STT and TTS from 01_STT / 01_TTS, failing over down each list
+    providers = ctx.proc.userdata.get("providers") or ProviderRegistry(vad=vad)
+    stt = providers.stt
+    tts = providers.tts
+    providers_warm = asyncio.create_task(providers.prewarm())
 
-    tts_provider = os.getenv('01_TTS', '').lower()
-    stt_provider = os.getenv('01_STT', '').lower()
-
-    # todo: remove this 
-    tts_provider = "elevenlabs"
-    stt_provider = "deepgram"
-
-    # Add plugins here
-    if tts_provider == 'openai':
-        tts = openai.TTS()
-    elif tts_provider == 'local':
-        tts = openai.TTS(base_url="http://localhost:9001/v1")
-        print("using local tts")
-    elif tts_provider == 'elevenlabs':
-        tts = elevenlabs.TTS()
-        print("using elevenlabs tts")
-    elif tts_provider == 'cartesia':
-        tts = cartesia.TTS()
-    else:
-        raise ValueError(f"Unsupported TTS provider: {tts_provider}. Please set 01_TTS environment variable to 'openai' or 'elevenlabs'.")
+    async def _log_provider_stats():
+        log_message("provider stats: %s", providers.summary())
 
-    if stt_provider == 'deepgram':
-        stt = deepgram.STT()
-    elif stt_provider == 'local':
-        stt = openai.STT(base_url="http://localhost:9002/v1")
-        print("using local stt")
-    else:
-        raise ValueError(f"Unsupported STT provider: {stt_provider}. Please set 01_STT environment variable to 'deepgram'.")
+    ctx.add_shutdown_callback(_log_provider_stats)
+
+    # the greeting, violation warnings and other repeated phrases are played from the cache
+    if TTS_CACHE_ENABLED:
+        tts = CachedTTS(tts)
+
+        async def _log_tts_cache_stats():
+            log_message("tts cache: %s", tts.cache.stats())
+
+        ctx.add_shutdown_callback(_log_tts_cache_stats)
 
     ############################################################
     # initialize voice assistant states
     ############################################################
     push_to_talk = False
-    current_message: ChatMessage = ChatMessage(role='user')
-    submitted_message: ChatMessage = ChatMessage(role='user')
+    transcript = TranscriptAccumulator()
     video_muted = False
     video_context = False
 
     tasks = []
+
+    # per-turn latency spans, written to the trace file and summarized on shutdown
+    tracer = TurnTracer(session=ctx.room.name)
+
+    async def _print_latency_summary():
+        tracer.print_summary()
+
+    ctx.add_shutdown_callback(_print_latency_summary)
+
+    ############################################################
+    # LLM request helper
+    ############################################################
+    async def _start_llm_stream(
+        agent: VoicePipelineAgent,
+        chat_ctx: ChatContext,
+        speculative: bool = False,
+        use_video_context: bool = False,
+    ) -> LLMStream:
+        """Attach a video frame, compact the context and start the LLM request
+
+        With use_video_context the frame is the timeline mosaic when the client
+        turned video context on, as push-to-talk turns do.
+        """
+        # speculative requests start before the turn does, so they aren't traced
+        trace = not speculative
+
+        if remote_video_processor and not video_muted:
+            if trace:
+                tracer.mark("vision_frame_start")
+            if use_video_context and remote_video_processor.get_video_context():
+                log_message("retrieving timeline frame")
+                video_frame = await remote_video_processor.get_timeline_frame()
+            else:
+                video_frame = await remote_video_processor.get_current_frame()
+            if video_frame:
+                image_stats = await image_budget.attach(chat_ctx, video_frame)
+                if trace:
+                    tracer.annotate(**image_stats)
+            else:
+                log_message("[before_llm_cb] No video frame available")
+            if trace:
+                tracer.mark("vision_frame_end")
+
+        context_tokens = context_compactor.compact(chat_ctx)
+        if trace:
+            tracer.annotate(context_tokens=context_tokens)
+            if tracer.turn_index == 1 and interpreter_client:
+                warm_up_s = interpreter_client.warm_up_s
+                tracer.annotate(interpreter_warm_up_ms=round(warm_up_s * 1000, 1) if warm_up_s is not None else None)
+            tracer.mark("llm_request")
+        stream = agent.llm.chat(
+            chat_ctx=chat_ctx,
+            fnc_ctx=agent.fnc_ctx,
+        )
+        # counted towards the worker's load until the response is complete
+        return TrackedLLMStream(agent.llm, stream)
+
+    ############################################################
+    # speculative LLM requests
+    ############################################################
+    agent_speaking = False
+
+    async def _speculate(text: str) -> LLMStream | None:
+        # while the agent speaks the user is interrupting it, and the agent adds
+        # what it said so far to the context, which a request made now would lack
+        if push_to_talk or agent_speaking:
+            return None
+        chat_ctx = assistant.chat_ctx.copy()
+        chat_ctx.append(role="user", text=text)
+        return await _start_llm_stream(assistant, chat_ctx, speculative=True)
+
+    # a speculative request to the in-process interpreter could run code for a guess
+    speculator = SpeculativeLLM(_speculate, enabled=SPECULATIVE_LLM and INTERPRETER_BACKEND != "in-process")
+
+    async def _close_speculator():
+        await speculator.aclose()
+        log_message("speculative llm: %s", speculator.stats())
+        if speculator.enabled and tracer.enabled:
+            print(f"speculative llm: {speculator.stats()}")
+
+    ctx.add_shutdown_callback(_close_speculator)
+
     ############################################################
     # before_llm_cb
     ############################################################
@@ -138,53 +278,35 @@ async def entrypoint(ctx: JobContext):
     ) -> Awaitable[LLMStream] | Literal[False]:
         nonlocal push_to_talk
         nonlocal remote_video_processor
-        nonlocal current_message
-        nonlocal submitted_message
-        log_message(f"[before_llm_cb] chat_ctx before we perform any processing: {chat_ctx}")
+        tracer.mark("before_llm_cb")
+        log_message("[before_llm_cb] chat_ctx before we perform any processing: %s", chat_ctx)
 
 
         if push_to_talk:
             last_message = chat_ctx.messages[-1]
 
-            if submitted_message and isinstance(last_message.content, str):
-                log_message(f"[before_llm_cb] submitted_message: {submitted_message}")
-
-                # Find where submitted_messages ends in last_message
-                submitted_end_idx = 0 
-                while isinstance(submitted_message.content, str) and submitted_message.content[submitted_end_idx] == last_message.content[submitted_end_idx]:
-                    submitted_end_idx += 1
-                    if submitted_end_idx == len(submitted_message.content):
-                        break
-                
-                # Remove the submitted message from the accumulated messages
-                log_message(f"[before_llm_cb] submitted_end_idx: {submitted_end_idx}")
-
-                # Take messages after the submitted message
-                current_message = ChatMessage(role=last_message.role, content=last_message.content[submitted_end_idx:])
-                log_message(f"[before_llm_cb] current_message after removing submitted_message: {current_message}")
+            if isinstance(last_message.content, str):
+                pending = transcript.update(last_message.content)
+                log_message("[before_llm_cb] pending transcript at offset %s: %s", transcript.committed_offset, pending)
             else:
-                current_message = ChatMessage(role=last_message.role, content=last_message.content)
-                log_message(f"[before_llm_cb] current_message after removing submitted_message: {current_message}")
+                log_message("[before_llm_cb] Unsupported message content type: %s", last_message)
             
             # Continue without invoking LLM immediately
             return False  
         
         else: 
             async def process_query():
-                log_message(f"[before_llm_cb] processing query in VAD with chat_ctx: {chat_ctx}")
+                log_message("[before_llm_cb] processing query in VAD with chat_ctx: %s", chat_ctx)
 
-                if remote_video_processor and not video_muted:
-                    video_frame = await remote_video_processor.get_current_frame()
+                last_message = chat_ctx.messages[-1]
+                if isinstance(last_message.content, str):
+                    stream, head_start = await speculator.take(last_message.content)
+                    if stream:
+                        tracer.annotate(speculative_head_start_ms=round(head_start * 1000, 1))
+                        tracer.mark("llm_request")
+                        return stream
 
-                    if video_frame:
-                        chat_ctx.append(role="user", images=[ChatImage(image=video_frame)])
-                    else:
-                        log_message("[before_llm_cb] No video frame available")
-                    
-                return agent.llm.chat(
-                    chat_ctx=chat_ctx,
-                    fnc_ctx=agent.fnc_ctx,
-                )
+                return await _start_llm_stream(agent, chat_ctx)
 
             return process_query()
 
@@ -194,52 +316,24 @@ async def entrypoint(ctx: JobContext):
     async def _on_message_received(msg: str):
         nonlocal push_to_talk
         nonlocal remote_video_processor
-        nonlocal current_message
-        nonlocal submitted_message
 
         if msg == "{COMPLETE}":
+            tracer.start_turn("complete_received")
             chat_ctx = assistant.chat_ctx
-            log_message(f"[on_message_received] copied chat_ctx: {chat_ctx}")
-
-            # append image if available
-            if remote_video_processor and not video_muted:
-                if remote_video_processor.get_video_context():
-                    log_message("context is true")
-                    log_message("retrieving timeline frame")
-                    video_frame = await remote_video_processor.get_timeline_frame()
-                else:   
-                    log_message("context is false")
-                    log_message("retrieving current frame")
-                    video_frame = await remote_video_processor.get_current_frame()
-
-                if video_frame:
-                    chat_ctx.append(role="user", images=[ChatImage(image=video_frame)]) 
-                    log_message(f"[on_message_received] appended image: {video_frame} to chat_ctx: {chat_ctx}")
-
-            if isinstance(current_message.content, str):
-                chat_ctx.append(role=current_message.role, text=current_message.content)
-
-                # extend existing submitted_message content with the new message content 
-                if submitted_message and isinstance(submitted_message.content, str):
-                    submitted_message.content += current_message.content
-                else:
-                    submitted_message = current_message
-                log_message(f"[on_message_received] appended message: {current_message.content}")
-                log_message(f"[on_message_received] submitted_message is now {submitted_message}")
-                log_message(f"[on_message_received] chat_ctx is now {chat_ctx}")
-            elif isinstance(current_message.content, ChatImage):
-                chat_ctx.append(role=current_message.role, images=[current_message.content])
-                log_message(f"[on_message_received] appended message: {current_message.content}")
-                log_message(f"[on_message_received] submitted_messages is now {submitted_message}")
-                log_message(f"[on_message_received] chat_ctx is now {chat_ctx}")
+            log_message("[on_message_received] copied chat_ctx: %s", chat_ctx)
+
+            text = transcript.commit()
+            if text:
+                chat_ctx.append(role="user", text=text)
+                log_message("[on_message_received] appended message: %s", text)
+                log_message("[on_message_received] committed transcript up to offset %s", transcript.committed_offset)
+                log_message("[on_message_received] chat_ctx is now %s", chat_ctx)
             else:
-                log_message(f"[on_message_received] Unsupported message content type: {current_message}")
-            
-            current_message = ChatMessage(role='user')
-            log_message(f"[on_message_received] current_message reset to {current_message}")
+                log_message("[on_message_received] No pending transcript to submit")
 
-            # Generate a response
-            stream = assistant.llm.chat(chat_ctx=chat_ctx)
+            # Generate a response, with the frame (or timeline) the user is looking at
+            speculator.reset()
+            stream = await _start_llm_stream(assistant, chat_ctx, use_video_context=True)
             await assistant.say(stream)
             return
         
@@ -256,7 +350,7 @@ async def entrypoint(ctx: JobContext):
         # so this copy is our default case where we just append the user's message to the chat_ctx
         chat_ctx = assistant.chat_ctx
         chat_ctx.append(role="user", text=msg)
-        log_message(f"[on_message_received] appended message: {msg} to chat_ctx: {chat_ctx}")
+        log_message("[on_message_received] appended message: %s to chat_ctx: %s", msg, chat_ctx)
 
         return
 
@@ -265,7 +359,7 @@ async def entrypoint(ctx: JobContext):
     ############################################################
     @chat.on("message_received")
     def on_chat_received(msg: rtc.ChatMessage):
-        log_message(f"Chat message received: {msg.message}")
+        log_message("Chat message received: %s", msg.message)
         if msg.message:
             asyncio.create_task(_on_message_received(msg.message))
 
@@ -279,9 +373,11 @@ async def entrypoint(ctx: JobContext):
         """Forward the transcription and log the transcript in the console"""
         async for ev in stt_stream:
             stt_forwarder.update(ev)
-            if ev.type == stt.SpeechEventType.INTERIM_TRANSCRIPT:
+            speculator.on_transcript(ev)
+            if ev.type == SpeechEventType.INTERIM_TRANSCRIPT:
                 print(ev.alternatives[0].text, end="")
-            elif ev.type == stt.SpeechEventType.FINAL_TRANSCRIPT:
+            elif ev.type == SpeechEventType.FINAL_TRANSCRIPT:
+                tracer.mark("stt_final")
                 print("\n")
                 print(" -> ", ev.alternatives[0].text)
 
@@ -290,7 +386,11 @@ async def entrypoint(ctx: JobContext):
         stt_forwarder = STTSegmentsForwarder(
             room=ctx.room, participant=participant, track=track
         )
-        stt_stream = stt.stream()
+        # non-streaming providers (the local STT server) need VAD to segment the audio
+        if stt.capabilities.streaming:
+            stt_stream = stt.stream()
+        else:
+            stt_stream = StreamAdapter(stt=stt, vad=vad).stream()
         stt_task = asyncio.create_task(
             _forward_transcription(stt_stream, stt_forwarder)
         )
@@ -308,7 +408,7 @@ async def entrypoint(ctx: JobContext):
         publication: rtc.TrackPublication,
         participant: rtc.RemoteParticipant,
     ):
-        log_message(f"Track subscribed: {track.kind}")
+        log_message("Track subscribed: %s", track.kind)
 
         if track.kind == rtc.TrackKind.KIND_AUDIO:
             tasks.append(asyncio.create_task(transcribe_track(participant, track)))
@@ -318,19 +418,33 @@ async def entrypoint(ctx: JobContext):
 
             remote_video_stream = rtc.VideoStream(track=track, format=rtc.VideoBufferType.RGBA)
             remote_video_processor = RemoteVideoProcessor(video_stream=remote_video_stream, job_ctx=ctx)
-            log_message("remote video processor." + str(remote_video_processor))
+            log_message("remote video processor. %s", remote_video_processor)
             
-            # Register safety check callback
+            # Register safety check callback, skipping frames that show the same scene as the last check
             remote_video_processor.register_safety_check_callback(
-                lambda frame: handle_instruction_check(assistant, frame)
+                lambda frame: handle_instruction_check(assistant, frame, scene_gate, owner=f"{ctx.room.name}/{participant.identity}", image_budget=image_budget)
             )
             
             remote_video_processor.set_video_context(video_context)
-            log_message(f"set video context to {video_context} from queued video context")
+            log_message("set video context to %s from queued video context", video_context)
             
             asyncio.create_task(remote_video_processor.process_frames())
 
 
+    ############################################################
+    # on participant disconnected callback
+    ############################################################
+    @ctx.room.on("participant_disconnected")
+    def on_participant_disconnected(participant: rtc.RemoteParticipant):
+        # don't keep paying for vision checks nobody will hear the result of
+        get_vision_client().cancel(f"{ctx.room.name}/{participant.identity}")
+
+        # a session room has a single user, end the job and free its slot once they leave
+        if is_session_room(ctx.room.name) and not ctx.room.remote_participants:
+            log_message("Session %s ended, shutting down", ctx.room.name)
+            ctx.shutdown(reason="session user left")
+
+
     ############################################################
     # on track muted callback
     ############################################################
@@ -339,7 +453,7 @@ async def entrypoint(ctx: JobContext):
         nonlocal video_muted
         if publication.kind == rtc.TrackKind.KIND_VIDEO:
             video_muted = True
-            log_message(f"Track muted: {publication.kind}")
+            log_message("Track muted: %s", publication.kind)
 
 
 
@@ -351,7 +465,7 @@ async def entrypoint(ctx: JobContext):
         nonlocal video_muted
         if publication.kind == rtc.TrackKind.KIND_VIDEO:
             video_muted = False
-            log_message(f"Track unmuted: {publication.kind}")
+            log_message("Track unmuted: %s", publication.kind)
 
 
     ############################################################
@@ -368,7 +482,7 @@ async def entrypoint(ctx: JobContext):
     def on_data_received(data: rtc.DataPacket):
         nonlocal video_context
         decoded_data = data.data.decode()
-        log_message(f"received data from {data.topic}: {decoded_data}")
+        log_message("received data from %s: %s", data.topic, decoded_data)
         if data.topic == "chat_context" and decoded_data == "{CLEAR_CHAT}":
             assistant.chat_ctx.messages.clear()
             assistant.chat_ctx.append(
@@ -377,8 +491,11 @@ async def entrypoint(ctx: JobContext):
                     "Only take into context the user's image if their message is relevant or pertaining to the image. Otherwise just keep in context that the image is present but do not acknowledge or mention it in your response."
                 ),
             )
-            log_message(f"cleared chat_ctx")
-            log_message(f"chat_ctx is now {assistant.chat_ctx}")
+            # the in-process interpreter keeps its own copy of the conversation
+            if isinstance(open_interpreter, InterpreterLLM):
+                open_interpreter.reset()
+            log_message("cleared chat_ctx")
+            log_message("chat_ctx is now %s", assistant.chat_ctx)
 
             asyncio.create_task(_publish_clear_chat())
 
@@ -399,47 +516,118 @@ async def entrypoint(ctx: JobContext):
                 log_message("no remote video processor found, queued video context to False")
 
 
+    ############################################################
+    # before_tts_cb
+    ############################################################
+    def _before_tts_cb(
+        agent: VoicePipelineAgent,
+        source: str | AsyncIterable[str]
+    ) -> str | AsyncIterable[str]:
+        if isinstance(source, str) or not tracer.enabled:
+            return source
+
+        async def _mark_first_token():
+            first = True
+            async for chunk in source:
+                if first:
+                    tracer.mark("llm_first_token")
+                    first = False
+                yield chunk
+
+        return _mark_first_token()
+
     ############################################################
     # Start the voice assistant with the LiveKit room
     ############################################################
 
     assistant = VoicePipelineAgent(
-        vad=silero.VAD.load(),
+        vad=vad,
         stt=stt,
         llm=open_interpreter,
         tts=tts,
         chat_ctx=initial_chat_ctx,
         before_llm_cb=_before_llm_cb,
+        before_tts_cb=_before_tts_cb,
     )
 
     assistant.start(ctx.room)
     await asyncio.sleep(1)
+    await providers_warm
 
     # Greets the user with an initial message
     await assistant.say(START_MESSAGE, allow_interruptions=True)
 
+    def _report_greeting_latency():
+        greeting_ms = (time.perf_counter() - job_start) * 1000
+        prewarmed_at = ctx.proc.userdata.get("prewarmed_at")
+        if prewarmed_at is None:
+            detail = "process was not prewarmed"
+        else:
+            detail = (
+                f"prewarm took {ctx.proc.userdata['prewarm_s'] * 1000:.0f} ms, "
+                f"finished {(job_start - prewarmed_at) * 1000:.0f} ms before the job"
+            )
+        log_message("job start to greeting: %.0f ms (%s)", greeting_ms, detail)
+        if tracer.enabled:
+            print(f"job start to greeting: {greeting_ms:.0f} ms ({detail})")
+
     ############################################################
     # wait for the voice assistant to finish
     ############################################################
+    greeted = False
+
     @assistant.on("agent_started_speaking")
     def on_agent_started_speaking():
+        nonlocal agent_speaking, greeted
+        agent_speaking = True
+        if not greeted:
+            greeted = True
+            _report_greeting_latency()
+        tracer.mark("playout_start")
+        # only goes back to full rate if the avatar image actually changed
+        static_publisher.set_image(image_np)
         asyncio.create_task(ctx.room.local_participant.publish_data(payload="{AGENT_STARTED_SPEAKING}", topic="agent_state"))
         log_message("Agent started speaking")
         return
     
     @assistant.on("agent_stopped_speaking")
     def on_agent_stopped_speaking():
+        nonlocal agent_speaking
+        agent_speaking = False
+        tracer.end_turn()
+        static_publisher.set_image(image_np)
         asyncio.create_task(ctx.room.local_participant.publish_data(payload="{AGENT_STOPPED_SPEAKING}", topic="agent_state"))
         log_message("Agent stopped speaking")
         return
 
+    @assistant.on("agent_speech_committed")
+    def on_agent_speech_committed(msg: ChatMessage):
+        # keeps the history itself bounded, not just the requests built from it
+        context_compactor.compact(assistant.chat_ctx)
+
+    @assistant.on("user_stopped_speaking")
+    def on_user_stopped_speaking():
+        # in push-to-talk mode the turn starts at {COMPLETE} instead
+        if not push_to_talk:
+            tracer.start_turn("vad_end")
+
+    @assistant.on("metrics_collected")
+    def on_metrics_collected(mtrcs: metrics.AgentMetrics):
+        if isinstance(mtrcs, metrics.PipelineTTSMetrics):
+            if tracer.has("llm_first_token") and mtrcs.ttfb >= 0:
+                tracer.mark_wall("tts_first_byte", mtrcs.timestamp - mtrcs.duration + mtrcs.ttfb)
+        elif isinstance(mtrcs, metrics.PipelineLLMMetrics):
+            tracer.annotate(llm_ttft_ms=round(mtrcs.ttft * 1000, 1))
+        elif isinstance(mtrcs, metrics.PipelineEOUMetrics):
+            tracer.annotate(end_of_utterance_delay_ms=round(mtrcs.end_of_utterance_delay * 1000, 1))
+
 
 def main(livekit_url: str):
     # Workers have to be run as CLIs right now.
     # So we need to simualte running "[this file] dev"
 
     worker_start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')
-    log_message(f"=== INITIALIZING NEW WORKER AT {worker_start_time} ===")
+    log_message("=== INITIALIZING NEW WORKER AT %s ===", worker_start_time)
     print(f"=== INITIALIZING NEW WORKER AT {worker_start_time} ===")
 
     # Modify sys.argv to set the path to this file as the first argument
@@ -450,9 +638,15 @@ def main(livekit_url: str):
     cli.run_app(
         WorkerOptions(
             entrypoint_fnc=entrypoint, 
+            prewarm_fnc=prewarm,
+            num_idle_processes=NUM_IDLE_PROCESSES,
+            initialize_process_timeout=PREWARM_TIMEOUT,
+            # stop taking jobs when busy so the server dispatches them to other workers
+            load_fnc=WorkerLoad(),
+            load_threshold=worker_load_threshold(),
             api_key="devkey", 
             api_secret="secret",
             ws_url=livekit_url
         )
 
-    )
\ No newline at end of file
+    )
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from source.server.livekit.code_runner import CodeRunner, OutputBuffer
+
+
+class FakeComputer:
+    """Streams the lines of code as output, sleeping on lines that say "sleep"."""
+
+    def __init__(self):
+        self.stopped = threading.Event()
+        self.stops = 0
+
+    def run(self, language, code, stream=False, display=True):
+        self.stopped.clear()
+        for line in code.splitlines():
+            if line == "sleep":
+                # blocks like a kernel would, until interrupted
+                if self.stopped.wait(10):
+                    return
+            else:
+                yield {"type": "console", "format": "output", "content": line}
+
+    def stop(self):
+        self.stops += 1
+        self.stopped.set()
+
+
+def test_output_at_the_limit_is_kept_whole():
+    output = OutputBuffer(max_chars=10)
+    output.append("abcde")
+    output.append("fghij")
+    assert output.text() == "abcdefghij"
+    assert output.dropped == 0
+
+
+def test_output_over_the_limit_keeps_head_and_tail():
+    output = OutputBuffer(max_chars=10)
+    for part in ("abc", "defgh", "ijklmnop", "qrstuvwxyz"):
+        output.append(part)
+
+    assert output.dropped == 16
+    assert output.text() == "abcde\n... [16 characters of output truncated] ...\nvwxyz"
+
+
+def test_timed_out_run_frees_the_runner():
+    computer = FakeComputer()
+    runner = CodeRunner(computer, timeout=0.2)
+
+    async def run_twice():
+        start = time.monotonic()
+        first = await runner.run("before\nsleep\nafter")
+        second = await runner.run("next")
+        return first, second, time.monotonic() - start
+
+    first, second, elapsed = asyncio.run(run_twice())
+    assert first == "before\n[execution stopped after 0.2 s]"
+    assert second == "next"
+    assert computer.stops == 1
+    assert elapsed < 2
+    runner.aclose()
+
+
+def test_cancelled_run_frees_the_runner():
+    computer = FakeComputer()
+    runner = CodeRunner(computer, timeout=10)
+
+    async def cancel_then_run():
+        task = asyncio.create_task(runner.run("sleep"))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return await asyncio.wait_for(runner.run("next"), 2)
+
+    assert asyncio.run(cancel_then_run()) == "next"
+    assert computer.stops == 1
+    runner.aclose()
@@ -0,0 +1,80 @@
+from livekit.agents.llm import ChatContext, ChatImage
+
+from source.server.livekit.context_compactor import SUMMARY_PREFIX, ChatContextCompactor, count_lmc_tokens, message_images, trim_lmc
+
+
+IMAGE = ChatImage(image="data:image/jpeg;base64,AAAA")
+
+
+def conversation(turns: int, images: int = 0) -> ChatContext:
+    chat_ctx = ChatContext().append(role="system", text="You are a helpful assistant.")
+    for i in range(turns):
+        chat_ctx.append(role="user", text=f"question {i} " + "x" * 200, images=[IMAGE] if i >= turns - images else [])
+        chat_ctx.append(role="assistant", text=f"answer {i} " + "y" * 200)
+    return chat_ctx
+
+
+def test_old_images_are_evicted_before_any_text():
+    chat_ctx = conversation(5, images=5)
+    compactor = ChatContextCompactor(max_tokens=100_000, max_images=2)
+    compactor.compact(chat_ctx)
+
+    assert len(chat_ctx.messages) == 11
+    assert [bool(message_images(msg)) for msg in chat_ctx.messages if msg.role == "user"] == [False, False, False, True, True]
+    assert compactor.stats() == {"context_tokens": compactor.count(chat_ctx), "images_evicted": 3, "messages_dropped": 0}
+
+
+def test_oldest_turns_are_folded_into_a_summary_after_the_system_prompt():
+    chat_ctx = conversation(20)
+    compactor = ChatContextCompactor(max_tokens=1000, max_images=2)
+    tokens = compactor.compact(chat_ctx)
+
+    system_prompt, summary = chat_ctx.messages[:2]
+    assert system_prompt.content == "You are a helpful assistant."
+    assert summary.role == "system" and summary.content.startswith(SUMMARY_PREFIX)
+    assert "answer" in summary.content and len(summary.content) <= len(SUMMARY_PREFIX) + 1 + compactor.summary_chars
+    # newest turns survive, in order
+    assert chat_ctx.messages[-1].content.startswith("answer 19")
+    assert all(msg.role != "system" for msg in chat_ctx.messages[2:])
+
+    stats = compactor.stats()
+    assert stats["messages_dropped"] == 40 - (len(chat_ctx.messages) - 2)
+    assert stats["context_tokens"] == tokens
+
+
+def test_summary_is_updated_rather_than_duplicated():
+    chat_ctx = conversation(20)
+    compactor = ChatContextCompactor(max_tokens=1000)
+    compactor.compact(chat_ctx)
+    first_summary = chat_ctx.messages[1].content
+    for i in range(20, 30):
+        chat_ctx.append(role="user", text=f"question {i} " + "x" * 200)
+    compactor.compact(chat_ctx)
+
+    summaries = [msg for msg in chat_ctx.messages if msg.role == "system" and msg.content.startswith(SUMMARY_PREFIX)]
+    assert len(summaries) == 1
+    assert chat_ctx.messages[1] is summaries[0]
+    assert summaries[0].content != first_summary
+
+
+def test_latest_message_is_always_kept():
+    chat_ctx = ChatContext().append(role="system", text="You are a helpful assistant.")
+    chat_ctx.append(role="user", text="z" * 10_000)
+    ChatContextCompactor(max_tokens=100).compact(chat_ctx)
+
+    assert [msg.role for msg in chat_ctx.messages] == ["system", "user"]
+
+
+def test_interpreter_history_is_cut_at_a_user_turn():
+    messages = []
+    for i in range(20):
+        messages.append({"role": "user", "type": "message", "content": f"question {i} " + "x" * 200})
+        messages.append({"role": "assistant", "type": "code", "format": "python", "content": "print(1)"})
+        messages.append({"role": "computer", "type": "console", "format": "output", "content": "1"})
+        messages.append({"role": "assistant", "type": "message", "content": f"answer {i} " + "y" * 200})
+
+    dropped = trim_lmc(messages, max_tokens=1000)
+    assert dropped and len(messages) == 80 - dropped
+    assert messages[0]["role"] == "user"
+    assert messages[-1]["content"].startswith("answer 19")
+    assert sum(count_lmc_tokens(message) for message in messages) <= 1000
@@ -0,0 +1,68 @@
+import asyncio
+from unittest.mock import patch
+
+import numpy as np
+from livekit.agents.llm import ChatContext, ChatImage
+from livekit.rtc import VideoFrame, VideoBufferType
+
+from source.server.livekit.frame_encoder import FrameEncoder
+from source.server.livekit.image_budget import ImageBudget, image_bytes, request_image_bytes
+
+
+def make_frame(width=640, height=480, seed=0):
+    # noise doesn't compress, so every frame has about the same size
+    image = np.random.default_rng(seed).integers(0, 256, (height, width, 4), dtype=np.uint8)
+    return VideoFrame(width, height, VideoBufferType.RGBA, image.tobytes())
+
+
+def images(chat_ctx):
+    return [content for msg in chat_ctx.messages if isinstance(msg.content, list)
+            for content in msg.content if isinstance(content, ChatImage)]
+
+
+def test_request_cap_drops_the_oldest_images():
+    async def attach_frames():
+        budget = ImageBudget(max_image_bytes=10**9)
+        chat_ctx = ChatContext().append(role="system", text="You are a helpful assistant.")
+        frame = make_frame()
+        size = (await budget.fit(frame))[1]
+        budget.max_request_bytes = size * 3
+
+        for _ in range(5):
+            await budget.attach(chat_ctx, frame)
+        return budget, chat_ctx, size
+
+    budget, chat_ctx, size = asyncio.run(attach_frames())
+
+    assert len(images(chat_ctx)) == 3
+    assert request_image_bytes(chat_ctx) <= budget.max_request_bytes
+    assert chat_ctx.messages[0].role == "system"
+    stats = budget.stats()
+    assert stats["images_sent"] == 5
+    assert stats["images_dropped"] == 2
+    assert stats["bytes_sent"] == 5 * size
+    assert stats["bytes_saved"] >= 2 * size
+
+
+def test_oversized_image_is_reduced_to_fit():
+    async def fit():
+        budget = ImageBudget(max_image_bytes=20 * 1024)
+        return await budget.fit(make_frame(1280, 720))
+
+    data_url, size = asyncio.run(fit())
+    assert size <= 20 * 1024
+    assert image_bytes(ChatImage(image=data_url)) == size
+
+
+def test_small_frame_is_encoded_once_for_the_check_and_the_turn():
+    async def check_then_attach():
+        encoder = FrameEncoder()
+        frame = make_frame(640, 480)
+        with patch("source.server.livekit.image_budget.get_frame_encoder", return_value=encoder):
+            # what the instruction check does, at the encoder's default edge
+            await encoder.data_url(frame)
+            await ImageBudget(max_image_bytes=10**9).attach(ChatContext(), frame)
+        return encoder
+
+    encoder = asyncio.run(check_then_attach())
+    assert encoder.encodes == 1
@@ -0,0 +1,56 @@
+import asyncio
+
+from source.server.livekit.kernel_pool import Kernel, KernelPool
+
+
+class FakeComputer:
+    def __init__(self):
+        self.terminated = False
+
+    def terminate(self):
+        self.terminated = True
+
+
+class FakeInterpreter:
+    def __init__(self):
+        self.computer = FakeComputer()
+
+
+class FakeKernelPool(KernelPool):
+    def __init__(self):
+        super().__init__()
+        self.started = 0
+
+    def _start_kernel(self) -> Kernel:
+        self.started += 1
+        kernel = Kernel(FakeInterpreter())
+        self._running.append(kernel)
+        return kernel
+
+
+def test_job_leases_the_prestarted_kernel_and_shuts_it_down():
+    pool = FakeKernelPool()
+    pool.fill()
+    pool.fill()
+    assert pool.started == 1
+
+    async def job():
+        kernel = await pool.lease()
+        assert pool.stats()["warm"]
+        await pool.release(kernel)
+        return kernel
+
+    kernel = asyncio.run(job())
+    assert pool.started == 1
+    # never handed to another session
+    assert kernel.computer.terminated
+
+
+def test_lease_without_prewarm_starts_a_kernel():
+    pool = FakeKernelPool()
+    kernel = asyncio.run(pool.lease())
+    assert pool.started == 1
+    assert not pool.stats()["warm"]
+
+    pool.close()
+    assert kernel.computer.terminated
@@ -0,0 +1,57 @@
+import os
+import time
+
+from source.server.livekit import logger
+
+
+def test_writer_survives_write_failures_and_bounds_its_queue(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(logger, "LOG_QUEUE_SIZE", 100)
+    writer = logger._LogWriter(str(tmp_path / "missing" / "worker.txt"))
+    writer.start()
+    for i in range(1000):
+        writer.put((time.time(), "record %s", (i,), {}))
+    time.sleep(0.5)
+
+    assert writer.is_alive()
+    assert writer.queue.qsize() <= 100
+    assert writer.dropped + writer.failed + writer.queue.qsize() == 1000
+    assert "log writer" in capsys.readouterr().err
+
+    # writes again once the directory is there
+    os.mkdir(tmp_path / "missing")
+    writer.put((time.time(), "back %s", ("again",), {}))
+    writer.stop()
+    assert not writer.is_alive()
+    assert "back again" in (tmp_path / "missing" / "worker.txt").read_text()
+
+
+def test_rotation_done_by_another_process_is_not_repeated(tmp_path, monkeypatch):
+    monkeypatch.setattr(logger, "LOG_MAX_BYTES", 100)
+    path = str(tmp_path / "worker.txt")
+    first, second = logger._LogWriter(path), logger._LogWriter(path)
+    first._write("a" * 60 + "\n")
+    second._write("b" * 60 + "\n")
+    assert os.path.exists(path + ".1")
+    second._write("c\n")
+
+    # the first writer's file was rotated by the second, so it only reopens
+    first._write("d" * 60 + "\n")
+    assert not os.path.exists(path + ".2")
+    assert open(path + ".1").read().startswith("a")
+
+    first._write("e" * 120 + "\n")
+    assert open(path + ".1").read().startswith("c")
+
+
+def test_mutable_args_are_logged_as_they_were():
+    from livekit.agents.llm import ChatContext
+
+    chat_ctx = ChatContext().append(role="user", text="hello")
+    snapshot = logger._snapshot(chat_ctx)
+    chat_ctx.append(role="user", text="later")
+    items = [1]
+    copied = logger._snapshot(items)
+    items.append(2)
+
+    assert len(snapshot.messages) == 1
+    assert copied == [1]
@@ -0,0 +1,32 @@
+import numpy as np
+from livekit.rtc import VideoFrame, VideoBufferType
+
+from source.server.livekit.timeline import VideoTimeline
+
+
+def make_frame(value, width=1280, height=720):
+    image = np.full((height, width, 4), value, dtype=np.uint8)
+    return VideoFrame(width, height, VideoBufferType.RGBA, image.tobytes())
+
+
+def test_timeline_memory_stays_within_budget():
+    timeline = VideoTimeline(max_bytes=1_000_000, long_edge=320)
+    for i in range(1000):
+        timeline.add(make_frame((i * 37) % 256), i * 100_000)
+
+    assert timeline.nbytes <= 1_000_000
+    assert len(timeline) == timeline.capacity
+
+
+def test_timeline_keeps_only_scene_changes():
+    timeline = VideoTimeline(max_bytes=4_000_000, long_edge=320, mosaic_frames=4)
+    kept = [timeline.add(make_frame((i // 10) * 40), i * 100_000) for i in range(50)]
+
+    assert sum(kept) == 5
+
+    mosaic = timeline.mosaic()
+    pixels = np.frombuffer(mosaic.data, dtype=np.uint8).reshape(mosaic.height, mosaic.width, 4)
+    assert (mosaic.width, mosaic.height) == (640, 360)
+    # oldest of the last four keyframes top-left, newest bottom-right
+    assert pixels[0, 0, 0] == 40
+    assert pixels[-1, -1, 0] == 160
@@ -0,0 +1,17 @@
+from source.server.livekit.tracing import percentile
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(10, 0, -1))
+    assert percentile(values, 50) == 5
+    assert percentile(values, 90) == 9
+    assert percentile(values, 99) == 10
+    assert percentile(values, 100) == 10
+    assert percentile(values, 0) == 1
+
+
+def test_percentile_of_small_lists():
+    assert percentile([7.5], 50) == 7.5
+    assert percentile([1, 2], 50) == 1
+    assert percentile([1, 2, 3], 50) == 2
+    assert percentile([1, 2, 3, 4], 90) == 4
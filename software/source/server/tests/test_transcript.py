@@ -0,0 +1,54 @@
+from source.server.livekit.transcript import TranscriptAccumulator, extends_text
+
+
+def test_handed_over_segments_accumulate_until_commit():
+    # the agent drops text it has handed to before_llm_cb, so each call only has the new part, without a leading space
+    transcript = TranscriptAccumulator()
+    assert transcript.update("help me") == "help me"
+    assert transcript.update("with this") == "help me with this"
+    assert transcript.commit() == "help me with this"
+    assert transcript.pending == ""
+
+
+def test_segments_are_joined_with_a_space():
+    transcript = TranscriptAccumulator()
+    transcript.update("hello there")
+    assert transcript.update("how are you") == "hello there how are you"
+
+
+def test_new_question_after_commit_is_kept_whole():
+    transcript = TranscriptAccumulator()
+    transcript.update("what is the weather in Paris")
+    transcript.commit()
+    assert transcript.update("what is the capital of France") == "what is the capital of France"
+
+
+def test_question_extending_a_committed_one_is_kept_whole():
+    transcript = TranscriptAccumulator()
+    transcript.update("what time is it")
+    transcript.commit()
+    assert transcript.update("what time is it in Tokyo") == "what time is it in Tokyo"
+    assert transcript.commit() == "what time is it in Tokyo"
+    assert transcript.committed == "what time is it what time is it in Tokyo"
+    assert transcript.committed_offset == len(transcript.committed)
+
+
+def test_segment_sharing_words_with_pending_text_does_not_replace_it():
+    transcript = TranscriptAccumulator()
+    transcript.update("turn on the light")
+    assert transcript.update("turn on the fan") == "turn on the light turn on the fan"
+
+
+def test_segment_handed_over_again_replaces_pending_text():
+    transcript = TranscriptAccumulator()
+    transcript.update("turn on")
+    assert transcript.update(" turn on the light") == "turn on the light"
+    assert transcript.repeats == 1
+    assert transcript.update("  ") == "turn on the light"
+
+
+def test_extends_text_stops_at_word_boundary():
+    assert extends_text("turn on the light", "turn on")
+    assert extends_text("turn on", "turn on")
+    assert not extends_text("turn one", "turn on")
+    assert not extends_text("turn", "turn on")
@@ -0,0 +1,92 @@
+import asyncio
+import os
+import time
+from types import SimpleNamespace
+
+from livekit import rtc
+from livekit.agents import tts, utils
+
+from source.server.livekit.tts_cache import TTS_CACHE_MAX_CHARS, CachedTTS, TTSCache
+
+
+SAMPLE_RATE = 16000
+
+
+class FakeChunkedStream(tts.ChunkedStream):
+    async def _run(self):
+        # 100 ms of audio whose samples depend on the text
+        sample = len(self._input_text) % 256
+        frame = rtc.AudioFrame(
+            data=bytes([sample, 0]) * (SAMPLE_RATE // 10),
+            sample_rate=SAMPLE_RATE,
+            num_channels=1,
+            samples_per_channel=SAMPLE_RATE // 10,
+        )
+        self._event_ch.send_nowait(tts.SynthesizedAudio(frame=frame, request_id=utils.shortuuid()))
+
+
+class FakeTTS(tts.TTS):
+    def __init__(self, voice="alloy"):
+        super().__init__(capabilities=tts.TTSCapabilities(streaming=False), sample_rate=SAMPLE_RATE, num_channels=1)
+        self._opts = SimpleNamespace(voice=voice, model="tts-1")
+        self.calls = []
+
+    def synthesize(self, text, *, conn_options=None):
+        self.calls.append(text)
+        return FakeChunkedStream(tts=self, input_text=text)
+
+
+async def synthesize(cached_tts: CachedTTS, text: str) -> bytes:
+    return b"".join([bytes(audio.frame.data) async for audio in cached_tts.synthesize(text)])
+
+
+def test_repeated_text_is_played_from_the_cache(tmp_path):
+    provider = FakeTTS()
+    cached_tts = CachedTTS(provider, cache=TTSCache(str(tmp_path)))
+
+    async def speak_twice():
+        return await synthesize(cached_tts, "Hello there."), await synthesize(cached_tts, "  Hello there.\n")
+
+    first, second = asyncio.run(speak_twice())
+    assert first == second and len(first) == SAMPLE_RATE // 10 * 2
+    assert provider.calls == ["Hello there."]
+    stats = cached_tts.cache.stats()
+    assert (stats["hits"], stats["misses"], stats["disk_hits"]) == (1, 1, 0)
+
+
+def test_disk_tier_is_shared_across_caches(tmp_path):
+    asyncio.run(synthesize(CachedTTS(FakeTTS(), cache=TTSCache(str(tmp_path))), "Hello there."))
+
+    provider = FakeTTS()
+    cache = TTSCache(str(tmp_path))
+    asyncio.run(synthesize(CachedTTS(provider, cache=cache), "Hello there."))
+    assert provider.calls == []
+    assert cache.stats()["disk_hits"] == 1
+
+
+def test_cache_key_covers_the_provider_and_skips_long_texts():
+    alloy, shimmer = CachedTTS(FakeTTS("alloy"), cache=TTSCache()), CachedTTS(FakeTTS("shimmer"), cache=TTSCache())
+
+    assert alloy.cache_key("Hi!") == alloy.cache_key(" Hi! ")
+    assert alloy.cache_key("Hi!") != alloy.cache_key("hi!")
+    assert alloy.cache_key("Hi!") != shimmer.cache_key("Hi!")
+    assert alloy.cache_key("x" * (TTS_CACHE_MAX_CHARS + 1)) is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = TTSCache(str(tmp_path), memory_bytes=250, disk_bytes=250)
+
+    async def fill():
+        for key, age in (("a", 10), ("b", 20)):
+            await cache.put(key, b"x" * 100)
+            # the disk tier's LRU order is the files' mtime, b is the oldest
+            os.utime(tmp_path / f"{key}.pcm", (time.time() - age, time.time() - age))
+        # in memory a becomes the most recently used
+        await cache.get("a")
+        await cache.put("c", b"x" * 100)
+
+    asyncio.run(fill())
+    assert list(cache._memory) == ["a", "c"]
+    assert cache.stats()["memory_bytes"] == 200
+    assert sorted(os.listdir(tmp_path)) == ["a.pcm", "c.pcm"]
+    assert cache.stats()["evictions"] == 1
@@ -0,0 +1,46 @@
+import subprocess
+import sys
+
+
+def measure_import_times(module: str, cwd: str | None = None) -> list[tuple[str, int, int]]:
+    """Import module in a fresh interpreter under -X importtime.
+
+    Returns (module, self us, cumulative us) for everything it imported, in
+    the order the imports finished.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        error = result.stderr.strip().splitlines()
+        raise ImportError(error[-1] if error else f"importing {module} failed")
+
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        if not self_us.strip().isdigit():
+            # the header line
+            continue
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def import_time_report(modules: list[str], cwd: str | None = None, top: int = 10) -> str:
+    """Cold import time of each module, with the slowest modules it pulls in."""
+    lines = []
+    for module in modules:
+        try:
+            rows = measure_import_times(module, cwd)
+        except ImportError as e:
+            lines.append(f"{module:<60}  failed: {e}")
+            continue
+        total = next((cumulative for name, _, cumulative in rows if name == module), 0)
+        lines.append(f"{module:<60}{total / 1000:>10.1f} ms  ({len(rows)} modules)")
+        for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[1], reverse=True)[:top]:
+            lines.append(f"    {name:<56}{self_us / 1000:>10.1f} ms self{cumulative_us / 1000:>10.1f} ms cumulative")
+    return "\n".join(lines)
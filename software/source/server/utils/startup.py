@@ -0,0 +1,119 @@
+import os
+import socket
+import subprocess
+import time
+import urllib.error
+import urllib.request
+from dataclasses import dataclass, field
+from typing import Callable
+
+
+# How long a service may take to become ready before startup gives up on it, in seconds
+STARTUP_TIMEOUT = float(os.getenv('01_STARTUP_TIMEOUT', '120'))
+# Delay between readiness probes, doubled after every failed round up to the max
+PROBE_INTERVAL = 0.05
+PROBE_MAX_INTERVAL = 0.5
+
+
+class StartupError(Exception):
+    pass
+
+
+def tcp_probe(host: str, port: int, timeout: float = 0.5) -> Callable[[], bool]:
+    """Ready once something accepts connections on host:port."""
+    def probe() -> bool:
+        try:
+            with socket.create_connection((host, port), timeout=timeout):
+                return True
+        except OSError:
+            return False
+    return probe
+
+
+def http_probe(url: str, timeout: float = 2.0) -> Callable[[], bool]:
+    """Ready once url answers with any HTTP response."""
+    def probe() -> bool:
+        try:
+            with urllib.request.urlopen(url, timeout=timeout):
+                return True
+        except urllib.error.HTTPError:
+            # an error status still means the server is up
+            return True
+        except (urllib.error.URLError, OSError):
+            return False
+    return probe
+
+
+@dataclass
+class Service:
+    name: str
+    process: subprocess.Popen
+    probe: Callable[[], bool]
+    timeout: float
+    launched_at: float
+    ready_at: float | None = None
+
+
+@dataclass
+class Startup:
+    """Launches the child processes at once and waits on readiness probes, not sleeps.
+
+    Every time is recorded relative to the creation of the Startup, so
+    report() shows where cold start time goes.
+    """
+
+    started_at: float = field(default_factory=time.monotonic)
+    services: dict[str, Service] = field(default_factory=dict)
+    stages: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def processes(self) -> list[subprocess.Popen]:
+        return [service.process for service in self.services.values()]
+
+    def elapsed_ms(self, at: float | None = None) -> float:
+        return ((time.monotonic() if at is None else at) - self.started_at) * 1000
+
+    def launch(self, name: str, cmd, probe: Callable[[], bool], timeout: float = STARTUP_TIMEOUT, **popen_kwargs) -> subprocess.Popen:
+        """Start a child process without waiting for it."""
+        process = subprocess.Popen(cmd, **popen_kwargs)
+        self.services[name] = Service(name, process, probe, timeout, time.monotonic())
+        return process
+
+    def mark(self, stage: str):
+        """Record when a step other than a service, e.g. the worker starting, happened."""
+        self.stages[stage] = time.monotonic()
+
+    def wait(self, *names: str):
+        """Block until the named services are ready, probing them all in turn.
+
+        Raises StartupError as soon as one exits or misses its timeout.
+        """
+        pending = [self.services[name] for name in names if self.services[name].ready_at is None]
+        interval = PROBE_INTERVAL
+        while pending:
+            for service in list(pending):
+                if service.probe():
+                    service.ready_at = time.monotonic()
+                    pending.remove(service)
+                    print(f"{service.name} ready after {self.elapsed_ms(service.ready_at):.0f} ms")
+                elif service.process.poll() is not None:
+                    raise StartupError(f"{service.name} exited with code {service.process.returncode} before it was ready")
+                elif time.monotonic() - service.launched_at > service.timeout:
+                    raise StartupError(f"{service.name} was not ready after {service.timeout:.0f} s")
+            if pending:
+                time.sleep(interval)
+                interval = min(interval * 2, PROBE_MAX_INTERVAL)
+
+    def report(self) -> str:
+        """Launch and ready times of each service and step, in ms since startup began."""
+        lines = ["startup timing (ms since start)", f"{'':<14}{'launched':>10}{'ready':>10}{'took':>10}"]
+        for service in self.services.values():
+            launched = self.elapsed_ms(service.launched_at)
+            if service.ready_at is None:
+                lines.append(f"{service.name:<14}{launched:>10.0f}{'-':>10}{'-':>10}")
+            else:
+                ready = self.elapsed_ms(service.ready_at)
+                lines.append(f"{service.name:<14}{launched:>10.0f}{ready:>10.0f}{ready - launched:>10.0f}")
+        for stage, at in self.stages.items():
+            lines.append(f"{stage:<14}{'':>10}{self.elapsed_ms(at):>10.0f}")
+        return "\n".join(lines)